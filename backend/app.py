@@ -1,25 +1,85 @@
 from __future__ import annotations
 
+import time
+
+_boot_started = time.perf_counter()
+
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
+import json
 import logging
 import os
+import re
+import threading
+from zlib import crc32
 from uuid import uuid4
 
-from flask import Flask, jsonify, request, Response
+from flask import Flask, g, jsonify, request, Response, send_file
 from flask_cors import CORS
+import numpy as np
 
-from services.semantic_store import SemanticStore
-from services import storage, recommendations, plants
-from services.mqtt_bridge import MQTTBridge
+from services.semantic_store import FORMAT_MAP as SEMANTIC_FORMATS, InvalidQuery, QueryBusy, QueryTimeout, SemanticStore
+from services import storage, recommendations, plants, uplink
+from services.mqtt_bridge import AsyncMQTTBridge, MQTTBridge
+from services.ingest_queue import IngestQueue
+from services.observation_cache import timestamp_key
+from services.live_updates import EventBroker
+from services.rollups import RollupIndex
+from services.stream_analysis import StreamAnalyzer
+from services.dedup import DedupCache
+from services.metrics import ENABLED as METRICS_ENABLED, REGISTRY, StageTimer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("smartplant.app")
 
+# Duración (s) de cada etapa del arranque del worker; se publica en /api/health.
+STARTUP_TIMINGS: Dict[str, float] = {}
+_stage_started = _boot_started
+
+
+def _startup_stage(name: str) -> None:
+    global _stage_started
+    now = time.perf_counter()
+    STARTUP_TIMINGS[name] = round(now - _stage_started, 4)
+    _stage_started = now
+
+
+_startup_stage("imports")
+
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "smartplant_ingest_stage_seconds", "Duración de cada etapa de ingest_observations", ("stage", "transport")
+)
+INGESTED_TOTAL = REGISTRY.counter(
+    "smartplant_ingested_observations_total", "Lecturas almacenadas", ("transport",)
+)
+INGEST_ERRORS_TOTAL = REGISTRY.counter(
+    "smartplant_ingest_errors_total",
+    "Lecturas rechazadas (invalid) o que fallaron (error)",
+    ("transport", "reason"),
+)
+INGEST_DUPLICATES_TOTAL = REGISTRY.counter(
+    "smartplant_ingest_duplicates_total", "Reentregas descartadas por clave de idempotencia", ("transport",)
+)
+ANALYSIS_EVENTS_TOTAL = REGISTRY.counter(
+    "smartplant_analysis_alert_changes_total",
+    "Alertas de rango/tendencia levantadas o retiradas",
+    ("feature", "kind", "status"),
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "smartplant_http_request_seconds", "Latencia de las peticiones por ruta", ("route", "method", "status")
+)
+
 app = Flask(__name__)
 CORS(app)
 
+# Con RDF_LOAD_MODE=background (por defecto) el grafo se carga en segundo plano.
 semantic_store = SemanticStore()
+_startup_stage("semanticStore")
+event_broker = EventBroker()
+rollup_index = RollupIndex()
+stream_analyzer = StreamAnalyzer()
+dedup_cache = DedupCache()
 
 
 def _iso_now() -> str:
@@ -33,11 +93,66 @@ def _as_float(value: Any, field: str) -> float:
         raise ValueError(f"Campo {field} inválido")
 
 
-def ingest_observation(body: Dict[str, Any]) -> Dict[str, Any]:
-    if not body:
+DEVICE_AUTO_REGISTER = os.getenv("DEVICE_AUTO_REGISTER", "true").lower() != "false"
+# Tope del registro para el alta automática: cada deviceId nuevo reescribe devices.json.
+DEVICE_REGISTRY_MAX = int(os.getenv("DEVICE_REGISTRY_MAX", "1000"))
+_registry_full_logged = False
+_DEVICE_ID_MAX_LENGTH = 64
+
+
+def _device_id(body: Dict[str, Any]) -> str | None:
+    device_id = body.get("deviceId")
+    if device_id is None or device_id == "":
+        return None
+    if not isinstance(device_id, str) or len(device_id) > _DEVICE_ID_MAX_LENGTH or "/" in device_id:
+        raise ValueError("deviceId inválido")
+    return device_id
+
+
+def _effective_config(device: Dict[str, Any] | None, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Config de la planta asignada al dispositivo o, si no tiene, la config activa global."""
+    cfg_id = device.get("plantConfigId") if device else None
+    saved = storage.get_plant_config(cfg_id) if cfg_id else None
+    if saved is None:
+        return cfg
+    merged = {**cfg, **saved, "plantConfigId": cfg_id}
+    merged.pop("id", None)
+    return merged
+
+
+def _device_config(device_id: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    global _registry_full_logged
+    device = storage.get_device(device_id)
+    if device is None and DEVICE_AUTO_REGISTER:
+        device = storage.register_device(
+            {"id": device_id, "plantConfigId": None, "registeredAt": _iso_now()},
+            max_devices=DEVICE_REGISTRY_MAX,
+        )
+        if device is None:
+            # La lectura se acepta igualmente, con la configuración activa global.
+            if not _registry_full_logged:
+                logger.warning("Registro de dispositivos lleno (%d); no se registran más", DEVICE_REGISTRY_MAX)
+                _registry_full_logged = True
+        else:
+            logger.info("Dispositivo %s registrado", device_id)
+    return _effective_config(device, cfg)
+
+
+def _prepare_observation(
+    body: Dict[str, Any], cfg: Dict[str, Any], device_cfgs: Dict[str, Dict[str, Any]] | None = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Valida una lectura; `device_cfgs` cachea la config resuelta por deviceId dentro de un lote."""
+    if not body or not isinstance(body, dict):
         raise ValueError("JSON requerido")
 
-    cfg = storage.load_config()
+    device_id = _device_id(body)
+    if device_id:
+        if device_cfgs is None:
+            device_cfgs = {}
+        if device_id not in device_cfgs:
+            device_cfgs[device_id] = _device_config(device_id, cfg)
+        cfg = device_cfgs[device_id]
+
     plant_name = body.get("plantName", cfg["plantName"])
     location = body.get("location", cfg["location"])
     plant_type = body.get("plantType", cfg.get("plantType", "monstera-deliciosa"))
@@ -61,58 +176,350 @@ def ingest_observation(body: Dict[str, Any]) -> Dict[str, Any]:
         "illuminance": illuminance,
         "timestamp": timestamp,
         "plantConfigId": plant_config_id,
+        "deviceId": device_id,
     }
+    return observation, profile
 
-    storage.append_observation(observation)
-    semantic_store.add_observation(
-        payload={
-            "temperature": temperature,
-            "humidity": humidity,
-            "illuminance": illuminance,
-        },
-        meta={
-            "plantName": plant_name,
-            "location": location,
-            "timestamp": timestamp,
-            "plantType": plant_type,
-        },
-    )
-    recs = recommendations.build_recommendations(observation, profile)
 
-    return {
-        "stored": True,
-        "timestamp": timestamp,
-        "plantType": plant_type,
-        "plantProfile": profile,
-        "recommendations": recs,
-    }
+_MESSAGE_ID_MAX_LENGTH = 64
+# Sólo un timestamp con fracción de segundo distingue dos muestras del mismo nodo:
+# el formato binario v1 los trunca a segundos.
+_SUBSECOND_TIMESTAMP = re.compile(r"T\d{2}:\d{2}:\d{2}[.,]\d")
 
 
-def _handle_mqtt_payload(payload: Dict[str, Any]) -> None:
+def _idempotency_key(body: Dict[str, Any], observation: Dict[str, Any], source: str | None = None) -> str | None:
+    """Clave para descartar reentregas, siempre acotada al nodo que envía.
+
+    El nodo es su `deviceId` o, si no lo trae, `source` (la dirección remota en
+    HTTP). La clave es nodo + `messageId`, o nodo + timestamp si éste tiene
+    fracción de segundo. Sin nodo o sin ninguno de los dos la lectura no es
+    identificable y se guarda siempre.
+    """
+    message_id = body.get("messageId")
+    if message_id is not None and message_id != "" and (
+        isinstance(message_id, bool)
+        or not isinstance(message_id, (str, int))
+        or len(str(message_id)) > _MESSAGE_ID_MAX_LENGTH
+    ):
+        raise ValueError("messageId inválido")
+    # Un deviceId no puede contener "/", así que las direcciones no chocan con él.
+    node = observation["deviceId"] or (f"addr/{source}" if source else None)
+    if node is None:
+        return None
+    if message_id is not None and message_id != "":
+        return f"{node}#{message_id}"
+    timestamp = body.get("timestamp")
+    if isinstance(timestamp, str) and _SUBSECOND_TIMESTAMP.search(timestamp):
+        return f"{node}@{observation['timestamp']}"
+    return None
+
+
+def ingest_observations(
+    bodies: List[Dict[str, Any]], transport: str = "http", source: str | None = None
+) -> List[Dict[str, Any]]:
+    """Valida y almacena un lote con una escritura de log y una persistencia RDF.
+
+    Si alguna lectura es inválida se lanza ValueError antes de escribir nada.
+    Las reentregas (misma clave de idempotencia) no se escriben: su resultado
+    lleva `stored: false` y `duplicate: true`. `transport` ("http" o "mqtt")
+    sólo etiqueta las métricas; `source` identifica al emisor de las lecturas
+    sin `deviceId` (ver _idempotency_key).
+    """
+    if not bodies:
+        raise ValueError("Lote vacío")
+
+    timer = StageTimer(INGEST_STAGE_SECONDS, transport=transport)
+    cfg = storage.load_config()
+    timer.lap("config")
+    candidates = []
+    keys = []
+    device_cfgs: Dict[str, Dict[str, Any]] = {}
+    for position, body in enumerate(bodies):
+        try:
+            observation, profile = _prepare_observation(body, cfg, device_cfgs)
+            keys.append(_idempotency_key(body, observation, source))
+        except ValueError as exc:
+            if len(bodies) > 1:
+                raise ValueError(f"Lectura {position}: {exc}") from exc
+            raise
+        candidates.append((observation, profile))
+    timer.lap("validate")
+
+    fresh = dedup_cache.claim(keys)
+    prepared = [item for item, is_fresh in zip(candidates, fresh) if is_fresh]
+    duplicates = len(candidates) - len(prepared)
+    if duplicates:
+        INGEST_DUPLICATES_TOTAL.inc(duplicates, transport=transport)
+        logger.info("%s lecturas repetidas descartadas", duplicates)
+    timer.lap("dedup")
+
+    if prepared:
+        try:
+            storage.append_observations([observation for observation, _ in prepared])
+            timer.lap("storage")
+            semantic_store.add_observations(
+                [
+                    (
+                        {
+                            "temperature": observation["temperature"],
+                            "humidity": observation["humidity"],
+                            "illuminance": observation["illuminance"],
+                        },
+                        {
+                            "plantName": observation["plantName"],
+                            "location": observation["location"],
+                            "timestamp": observation["timestamp"],
+                            "plantType": observation["plantType"],
+                        },
+                    )
+                    for observation, _ in prepared
+                ]
+            )
+        except Exception:
+            # Si la escritura falla, el reintento del nodo no debe tomarse por repetido.
+            dedup_cache.release([key for key, is_fresh in zip(keys, fresh) if is_fresh])
+            raise
+        timer.lap("rdf")
+
+    ranges = [plants.get_ranges(profile["id"]) for _, profile in prepared]
+    analyses = [
+        stream_analyzer.update(observation, profile_ranges)
+        for (observation, _), profile_ranges in zip(prepared, ranges)
+    ]
+    timer.lap("analysis")
+
+    results = [
+        {
+            "stored": True,
+            "timestamp": observation["timestamp"],
+            "plantType": observation["plantType"],
+            "plantProfile": profile,
+            "recommendations": recommendations.build_recommendations(observation, profile, profile_ranges),
+            "analysis": analysis,
+        }
+        for (observation, profile), profile_ranges, analysis in zip(prepared, ranges, analyses)
+    ]
+    timer.lap("recommendations")
+    for (observation, _), result in zip(prepared, results):
+        analysis = result["analysis"]
+        event_broker.publish(
+            "observation",
+            {"observation": observation, "recommendations": result["recommendations"], "analysis": analysis},
+        )
+        for change in analysis["events"]:
+            ANALYSIS_EVENTS_TOTAL.inc(feature=change["feature"], kind=change["kind"], status=change["status"])
+            logger.info(
+                "Alerta %s de %s en %s: %s", change["kind"], change["feature"], analysis["key"], change["status"]
+            )
+            event_broker.publish("alert", {"observation": observation, "key": analysis["key"], **change})
+    timer.lap("publish")
+    timer.total()
+    INGESTED_TOTAL.inc(len(prepared), transport=transport)
+    if not duplicates:
+        return results
+    stored = iter(results)
+    return [
+        next(stored)
+        if is_fresh
+        else {
+            "stored": False,
+            "duplicate": True,
+            "timestamp": observation["timestamp"],
+            "plantType": observation["plantType"],
+        }
+        for (observation, _), is_fresh in zip(candidates, fresh)
+    ]
+
+
+def ingest_observation(body: Dict[str, Any], transport: str = "http", source: str | None = None) -> Dict[str, Any]:
+    return ingest_observations([body], transport, source)[0]
+
+
+def _ingest_response(results: List[Dict[str, Any]], batch: bool = False) -> Tuple[Response, int]:
+    """201 si se guardó alguna lectura; 200 si todas eran reentregas ya guardadas."""
+    stored = sum(1 for result in results if result["stored"])
+    status = 201 if stored else 200
+    if len(results) == 1 and not batch:
+        return jsonify(results[0]), status
+    return jsonify({"stored": stored, "duplicates": len(results) - stored, "items": results}), status
+
+
+def _ingest_one(payload: Dict[str, Any], transport: str, source: str | None) -> None:
     try:
-        ingest_observation(payload)
-        logger.info("Observación recibida por MQTT")
+        ingest_observation(payload, transport, source)
+    except ValueError as exc:
+        INGEST_ERRORS_TOTAL.inc(transport=transport, reason="invalid")
+        logger.warning("Observación descartada: %s", exc)
     except Exception:
-        logger.exception("Error procesando mensaje MQTT")
+        INGEST_ERRORS_TOTAL.inc(transport=transport, reason="error")
+        logger.exception("Error procesando observación encolada")
+
+
+def _ingest_queued(items: List[Tuple[str, Dict[str, Any], str | None]]) -> None:
+    """Handler de la cola: cada elemento es (transporte, lectura, emisor)."""
+    by_transport: Dict[Tuple[str, str | None], List[Dict[str, Any]]] = {}
+    for transport, payload, source in items:
+        by_transport.setdefault((transport, source), []).append(payload)
+    for (transport, source), payloads in by_transport.items():
+        if len(payloads) == 1:
+            _ingest_one(payloads[0], transport, source)
+            continue
+        try:
+            ingest_observations(payloads, transport, source)
+            logger.info("Lote de %s observaciones almacenado", len(payloads))
+        except ValueError:
+            # Una lectura inválida no debe descartar el resto del lote.
+            logger.warning("Lote con lecturas inválidas, procesando una a una")
+            for payload in payloads:
+                _ingest_one(payload, transport, source)
+
+
+ingest_queue = IngestQueue(_ingest_queued)
+ingest_queue.start()
+_startup_stage("ingestQueue")
+QUEUE_MQTT = os.getenv("INGEST_QUEUE_MQTT", "true").lower() != "false"
+RDF_EXPORT_GZIP = os.getenv("RDF_EXPORT_GZIP", "true").lower() != "false"
+HTTP_ASYNC_DEFAULT = os.getenv("HTTP_INGEST_ASYNC", "false").lower() == "true"
+# Con `drop-oldest` un POST aceptado con 202 podría descartarse después sin que el
+# cliente lo sepa; por eso HTTP usa su propia política y espera o responde 503.
+HTTP_QUEUE_POLICY = os.getenv("INGEST_QUEUE_POLICY_HTTP", "block").lower()
+if HTTP_QUEUE_POLICY not in ("block", "drop-newest"):
+    raise ValueError(f"INGEST_QUEUE_POLICY_HTTP debe ser block o drop-newest: {HTTP_QUEUE_POLICY}")
+# Lecturas que resume /api/recommendations/history sin `since` (las más recientes).
+HISTORY_DEFAULT_LIMIT = int(os.getenv("RECOMMENDATIONS_HISTORY_LIMIT", "1000"))
+# Respuestas de /api/recommendations/latest por clave de consulta (LRU, ver _latest_key).
+RECOMMENDATIONS_CACHE_SIZE = int(os.getenv("RECOMMENDATIONS_CACHE_SIZE", "256"))
+_recommendations_cache: OrderedDict[Tuple[Any, Any, str], bytes] = OrderedDict()
+_recommendations_cache_lock = threading.Lock()
+
+
+def _handle_mqtt_payload(payload: Dict[str, Any]) -> None:
+    if QUEUE_MQTT:
+        ingest_queue.submit(("mqtt", payload, None))
+        return
+    _ingest_one(payload, "mqtt", None)
+    logger.info("Observación recibida por MQTT")
+
+
+def _handle_mqtt_batch(payloads: List[Dict[str, Any]]) -> None:
+    if QUEUE_MQTT:
+        ingest_queue.submit_many([("mqtt", payload, None) for payload in payloads])
+        return
+    _ingest_queued([("mqtt", payload, None) for payload in payloads])
 
 
-mqtt_bridge = MQTTBridge(_handle_mqtt_payload)
-if os.getenv("WERKZEUG_RUN_MAIN") == "true" or os.getenv("WERKZEUG_RUN_MAIN") is None:
+# Con el punto de entrada ASGI (asgi.py) el bridge corre en su bucle asyncio y lo arranca el lifespan.
+ASGI_MODE = os.getenv("SMARTPLANT_ASGI", "false").lower() == "true"
+mqtt_bridge = (AsyncMQTTBridge if ASGI_MODE else MQTTBridge)(_handle_mqtt_payload, batch_handler=_handle_mqtt_batch)
+if not ASGI_MODE and (os.getenv("WERKZEUG_RUN_MAIN") == "true" or os.getenv("WERKZEUG_RUN_MAIN") is None):
     mqtt_bridge.start()
+_startup_stage("mqtt")
+STARTUP_TIMINGS["total"] = round(time.perf_counter() - _boot_started, 4)
+logger.info("Worker %s listo en %.3f s %s", os.getpid(), STARTUP_TIMINGS["total"], STARTUP_TIMINGS)
+
+# Gauges: se calculan sólo cuando se consulta /api/metrics.
+REGISTRY.gauge("smartplant_rdf_triples", "Triples en el grafo", lambda: semantic_store.stats()["triples"])
+REGISTRY.gauge(
+    "smartplant_rdf_file_bytes",
+    "Tamaño de los ficheros del grafo",
+    lambda: {(name,): size for name, size in semantic_store.stats()["fileBytes"].items()},
+    ("file",),
+)
+REGISTRY.gauge("smartplant_rdf_ready", "1 cuando el grafo RDF está cargado", lambda: int(semantic_store.ready))
+REGISTRY.gauge(
+    "smartplant_observation_log_bytes", "Tamaño del histórico de observaciones", storage.log_size_bytes
+)
+REGISTRY.gauge(
+    "smartplant_ingest_queue_depth", "Lecturas en la cola de ingesta", lambda: ingest_queue.stats()["depth"]
+)
+REGISTRY.gauge(
+    "smartplant_ingest_queue_items",
+    "Contadores acumulados de la cola de ingesta",
+    lambda: {
+        (state,): value
+        for state, value in ingest_queue.stats().items()
+        if state in ("enqueued", "processed", "dropped", "failed")
+    },
+    ("state",),
+)
+REGISTRY.gauge("smartplant_ingest_dedup_keys", "Claves de idempotencia en memoria", lambda: len(dedup_cache))
+REGISTRY.gauge("smartplant_sse_subscribers", "Clientes SSE conectados", lambda: event_broker.subscriber_count)
+REGISTRY.gauge(
+    "smartplant_mqtt_connected", "1 si el bridge MQTT está conectado", lambda: int(mqtt_bridge.connected)
+)
+REGISTRY.gauge("smartplant_mqtt_leader", "1 si este proceso consume MQTT", lambda: int(mqtt_bridge.is_leader))
+
+
+@app.before_request
+def _start_request_timer() -> None:
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request_latency(response: Response) -> Response:
+    started = g.get("request_started")
+    if started is not None:
+        # Se etiqueta con la regla (/api/...) y no con la URL para acotar la cardinalidad.
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+
+@app.get("/api/metrics")
+def metrics() -> Response:
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Métricas desactivadas (METRICS_ENABLED=false)"}), 404
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.get("/api/health")
-def health() -> Dict[str, str]:
-    return {"status": "ok", "service": "smartplant-backend"}
+def health() -> Dict[str, Any]:
+    if semantic_store.load_error is not None:
+        status = "error"
+    else:
+        status = "ok" if semantic_store.ready else "starting"
+    return {
+        "status": status,
+        "service": "smartplant-backend",
+        "ready": semantic_store.ready,
+        "semanticStore": {
+            "ready": semantic_store.ready,
+            "loadMode": semantic_store.load_mode,
+            "loadSeconds": semantic_store.load_seconds,
+            "error": str(semantic_store.load_error) if semantic_store.load_error else None,
+        },
+        "mqtt": {"enabled": mqtt_bridge.enabled, "leader": mqtt_bridge.is_leader, "pid": os.getpid()},
+        "startup": STARTUP_TIMINGS,
+    }
+
+
+@app.get("/api/health/ready")
+def readiness() -> Response:
+    """Sonda de readiness: 503 mientras el grafo RDF se está cargando."""
+    ready = semantic_store.ready
+    return jsonify({"ready": ready}), 200 if ready else 503
+
+
+@app.get("/api/ingest/queue")
+def ingest_queue_stats() -> Response:
+    return jsonify(ingest_queue.stats())
 
 
 @app.get("/api/device")
 def device_info() -> Response:
+    device_id = request.args.get("deviceId")
     cfg = storage.load_config()
     topic = os.getenv("MQTT_TOPIC", "smartplant/observations")
+    if device_id:
+        cfg = _effective_config(storage.get_device(device_id), cfg)
+        if "+" in mqtt_bridge.device_topic.split("/"):
+            topic = mqtt_bridge.device_topic.replace("+", device_id, 1)
     host_http = request.host_url.rstrip("/")
     info = {
-        "id": "esp32-smartplant",
+        "id": device_id or "esp32-smartplant",
         "name": cfg.get("plantName", "SmartPlant"),
         "location": cfg.get("location", "Living Room"),
         "description": "Nodo ESP32 con DHT11 + LDR y actuadores LED de estado",
@@ -153,6 +560,50 @@ def device_info() -> Response:
     return jsonify(info)
 
 
+def _device_response(device: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = _effective_config(device, storage.load_config())
+    latest = storage.load_observations(limit=1, device_id=device["id"])
+    return {
+        **device,
+        "config": cfg,
+        "plantProfile": plants.get_profile(cfg.get("plantType")),
+        "lastSeen": latest[-1]["timestamp"] if latest else None,
+    }
+
+
+@app.get("/api/devices")
+def list_devices() -> Response:
+    return jsonify([_device_response(device) for device in storage.load_devices()])
+
+
+@app.get("/api/devices/<device_id>")
+def get_device(device_id: str) -> Response:
+    device = storage.get_device(device_id)
+    if device is None:
+        return jsonify({"error": "Dispositivo no encontrado"}), 404
+    return jsonify(_device_response(device))
+
+
+@app.post("/api/devices/<device_id>/activate")
+def activate_device_config(device_id: str) -> Response:
+    """Asigna una config guardada al dispositivo (`plantConfigId: null` vuelve a la config activa)."""
+    body = request.get_json(force=True, silent=True) or {}
+    if "plantConfigId" not in body:
+        return jsonify({"error": "plantConfigId requerido"}), 400
+    try:
+        _device_id({"deviceId": device_id})
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    cfg_id = body["plantConfigId"]
+    if cfg_id and storage.get_plant_config(cfg_id) is None:
+        return jsonify({"error": "Config no encontrada"}), 404
+    changes: Dict[str, Any] = {"plantConfigId": cfg_id or None}
+    if storage.get_device(device_id) is None:
+        changes["registeredAt"] = _iso_now()
+    device = storage.update_device(device_id, changes)
+    return jsonify(_device_response(device)), 200
+
+
 @app.post("/api/config")
 def save_config() -> Response:
     body = request.get_json(force=True, silent=True) or {}
@@ -187,6 +638,16 @@ def list_plants() -> Response:
     return jsonify(plants.get_plants())
 
 
+@app.post("/api/plants/reload")
+def reload_plants() -> Response:
+    try:
+        registry = plants.reload()
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        logger.exception("No se pudo recargar plants.json")
+        return jsonify({"error": f"No se pudo recargar plants.json: {exc}"}), 500
+    return jsonify({"version": registry.version, "count": len(registry.plants)})
+
+
 @app.get("/api/plants/configs")
 def list_saved_configs() -> Response:
     return jsonify(storage.load_plant_configs())
@@ -226,24 +687,169 @@ def activate_config() -> Response:
 
 @app.post("/api/observations")
 def create_observation() -> Response:
-    body = request.get_json(force=True)
+    if request.mimetype == uplink.CONTENT_TYPE:
+        try:
+            bodies = uplink.decode(request.get_data(cache=False))
+        except ValueError as exc:
+            INGEST_ERRORS_TOTAL.inc(transport="http", reason="invalid")
+            return jsonify({"error": str(exc)}), 400
+    else:
+        bodies = [request.get_json(force=True)]
+    if request.args.get("async", "true" if HTTP_ASYNC_DEFAULT else "false").lower() in ("1", "true"):
+        if not all(body and isinstance(body, dict) for body in bodies):
+            return jsonify({"error": "JSON requerido"}), 400
+        accepted = ingest_queue.submit_many(
+            [("http", body, request.remote_addr) for body in bodies], HTTP_QUEUE_POLICY
+        )
+        if accepted < len(bodies):
+            return jsonify({"error": "Cola de ingesta llena", "queued": accepted}), 503, {"Retry-After": "1"}
+        return jsonify({"queued": True, "queueDepth": ingest_queue.stats()["depth"]}), 202
     try:
-        result = ingest_observation(body)
+        results = ingest_observations(bodies, source=request.remote_addr)
     except ValueError as exc:
+        INGEST_ERRORS_TOTAL.inc(transport="http", reason="invalid")
         return jsonify({"error": str(exc)}), 400
     except Exception:
+        INGEST_ERRORS_TOTAL.inc(transport="http", reason="error")
         logger.exception("Fallo procesando observación HTTP")
         return jsonify({"error": "No se pudo almacenar la lectura"}), 500
-    return jsonify(result), 201
+    return _ingest_response(results)
+
+
+def _read_batch_body() -> List[Dict[str, Any]]:
+    """Acepta un array JSON, {"items": [...]}, NDJSON (una lectura por línea) o el formato binario."""
+    if request.mimetype == uplink.CONTENT_TYPE:
+        return uplink.decode(request.get_data(cache=False))
+    raw = request.get_data(cache=False, as_text=True)
+    if not raw.strip():
+        raise ValueError("JSON requerido")
+    if request.mimetype not in ("application/x-ndjson", "application/ndjson"):
+        try:
+            body = json.loads(raw)
+        except json.JSONDecodeError:
+            body = None
+        if isinstance(body, dict) and isinstance(body.get("items"), list):
+            return body["items"]
+        if isinstance(body, list):
+            return body
+    items = []
+    for number, line in enumerate(raw.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except json.JSONDecodeError:
+            raise ValueError(f"Línea {number} no es JSON válido")
+    return items
+
+
+@app.post("/api/observations/batch")
+def create_observations_batch() -> Response:
+    try:
+        results = ingest_observations(_read_batch_body(), source=request.remote_addr)
+    except ValueError as exc:
+        INGEST_ERRORS_TOTAL.inc(transport="http", reason="invalid")
+        return jsonify({"error": str(exc)}), 400
+    except Exception:
+        INGEST_ERRORS_TOTAL.inc(transport="http", reason="error")
+        logger.exception("Fallo procesando lote HTTP")
+        return jsonify({"error": "No se pudo almacenar el lote"}), 500
+    return _ingest_response(results, batch=True)
+
+
+def _latest_key() -> Tuple[Any, Any, str]:
+    """(versión de las observaciones, versión de plants.json, consulta normalizada completa)."""
+    # `wait` (sondeo largo en asgi.py) no cambia la respuesta.
+    query = "&".join(
+        f"{key}={value}" for key, value in sorted(request.args.items(multi=True)) if key != "wait"
+    )
+    query += f"&path={request.path}&default={storage.load_config().get('plantType')}"
+    return storage.observations_version(), plants.get_version(), query
+
+
+def _latest_etag(key: Tuple[Any, Any, str]) -> str:
+    """ETag de las consultas de últimas lecturas: cambia con cada ingesta."""
+    # El crc32 basta para un ETag, pero no para indexar cachés: ahí se usa la clave completa.
+    observations_version, plants_version, query = key
+    return f"{observations_version}.{plants_version}.{crc32(query.encode('utf-8')):08x}"
+
+
+def _not_modified(etag: str) -> Response | None:
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def _with_etag(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    # Obliga al navegador a revalidar con If-None-Match en cada sondeo.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.get("/api/stream")
+def stream_updates() -> Response:
+    return Response(
+        event_broker.stream(
+            plant_config_id=request.args.get("plantConfigId"),
+            plant_type=request.args.get("plantType"),
+            device_id=request.args.get("deviceId"),
+        ),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/observations/latest")
 def latest_observations() -> Response:
+    etag = _latest_etag(_latest_key())
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
     limit = request.args.get("limit", default=10, type=int)
     cfg_id = request.args.get("plantConfigId")
     plant_type = request.args.get("plantType")
-    data = storage.load_observations(limit=limit, plant_config_id=cfg_id, plant_type=plant_type)
-    return jsonify({"items": data, "count": len(data)})
+    try:
+        data = storage.load_observations(
+            limit=limit,
+            plant_config_id=cfg_id,
+            plant_type=plant_type,
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            device_id=request.args.get("deviceId"),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return _with_etag(jsonify({"items": data, "count": len(data)}), etag)
+
+
+@app.get("/api/observations/aggregate")
+def aggregate_observations() -> Response:
+    rollup_index.sync(storage.read_changes)
+    try:
+        since = request.args.get("since")
+        until = request.args.get("until")
+        points = rollup_index.query(
+            request.args.get("bucket", "1h"),
+            since=timestamp_key(since) if since else None,
+            until=timestamp_key(until) if until else None,
+            plant_config_id=request.args.get("plantConfigId"),
+            plant_type=request.args.get("plantType"),
+            device_id=request.args.get("deviceId"),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"bucket": request.args.get("bucket", "1h"), "items": points, "count": len(points)})
+
+
+@app.get("/api/analysis")
+def stream_analysis() -> Response:
+    """EWMA, desviación, tasa de cambio y alertas activas por planta (deviceId, plantConfigId o plantName)."""
+    filters = {key: request.args[key] for key in ("deviceId", "plantConfigId", "plantName") if request.args.get(key)}
+    items = stream_analyzer.snapshot(stream_analyzer.stream_key(filters) if filters else None)
+    return jsonify({"items": items, "count": len(items)})
 
 
 @app.get("/api/observations/rdf")
@@ -263,21 +869,169 @@ def rdf_dump() -> Response:
             ["application/ld+json", "text/turtle", "application/rdf+xml"],
             default="text/turtle",
         )
-    return Response(semantic_store.serialize(best), mimetype=best)
+    filters = {key: request.args.get(key) for key in ("since", "until", "plantName", "limit")}
+    limit = None
+    if filters["limit"]:
+        # Un limit no numérico no debe acabar en un subgrafo sin límite.
+        limit = request.args.get("limit", type=int)
+        if limit is None or limit <= 0:
+            return jsonify({"error": "limit debe ser un entero positivo"}), 400
+    if any(filters.values()):
+        try:
+            sub = semantic_store.subgraph(
+                since=filters["since"],
+                until=filters["until"],
+                plant_name=filters["plantName"],
+                limit=limit,
+            )
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        fmt = SEMANTIC_FORMATS.get(best, SEMANTIC_FORMATS["text/turtle"])[0]
+        return Response(sub.serialize(format=fmt), mimetype=best)
+
+    compressed = RDF_EXPORT_GZIP and "gzip" in request.accept_encodings
+    # La ruta queda reservada (no se poda) hasta que send_file abre el fichero;
+    # abierto, otra exportación puede borrarlo sin cortar el envío.
+    path, version = semantic_store.acquire_export(best, compressed=compressed)
+    try:
+        response = send_file(
+            path,
+            mimetype=best,
+            conditional=True,
+            # La versión del grafo es propia de cada worker.
+            etag=f"rdf-{os.getpid()}-{version}-{path.name}",
+            max_age=0,
+        )
+    finally:
+        semantic_store.release_export(path)
+    if compressed:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    return response
+
+
+@app.post("/api/sparql")
+def sparql_query() -> Response:
+    if request.mimetype == "application/sparql-query":
+        query = request.get_data(as_text=True)
+    elif request.is_json:
+        query = (request.get_json(silent=True) or {}).get("query")
+    else:
+        query = request.form.get("query")
+    if not query or not query.strip():
+        return jsonify({"error": "query requerida"}), 400
+    try:
+        body, mime = semantic_store.query(query)
+    except QueryTimeout as exc:
+        return jsonify({"error": str(exc)}), 504
+    except QueryBusy as exc:
+        return jsonify({"error": str(exc)}), 503, {"Retry-After": "1"}
+    except InvalidQuery as exc:
+        return jsonify({"error": str(exc)}), 400
+    except RuntimeError as exc:
+        # El grafo no llegó a cargarse (ver SemanticStore._ensure_loaded).
+        logger.error("Consulta SPARQL sin grafo: %s", exc)
+        return jsonify({"error": "Grafo RDF no disponible"}), 503
+    except Exception:
+        logger.exception("Fallo ejecutando consulta SPARQL")
+        return jsonify({"error": "No se pudo ejecutar la consulta"}), 500
+    return Response(body, mimetype=mime)
 
 
 @app.get("/api/recommendations/latest")
 def latest_recommendations() -> Response:
+    key = _latest_key()
+    etag = _latest_etag(key)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    # La clave cambia con cada lectura, con plants.json y con la consulta: si ya se
+    # respondió a esa combinación, la respuesta es la misma.
+    with _recommendations_cache_lock:
+        body = _recommendations_cache.get(key)
+        if body is not None:
+            _recommendations_cache.move_to_end(key)
+    if body is not None:
+        return _with_etag(Response(body, mimetype="application/json"), etag)
     cfg_id = request.args.get("plantConfigId")
     plant_type = request.args.get("plantType")
-    data = storage.load_observations(limit=1, plant_config_id=cfg_id, plant_type=plant_type)
+    try:
+        data = storage.load_observations(
+            limit=1,
+            plant_config_id=cfg_id,
+            plant_type=plant_type,
+            since=request.args.get("since"),
+            until=request.args.get("until"),
+            device_id=request.args.get("deviceId"),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
     if not data:
         return jsonify({"error": "Sin observaciones"}), 404
-    cfg = storage.load_config()
-    effective_type = data[-1].get("plantType") or plant_type or cfg.get("plantType")
+    effective_type = data[-1].get("plantType") or plant_type or storage.load_config().get("plantType")
     profile = plants.get_profile(effective_type)
-    recs = recommendations.build_recommendations(data[-1], profile)
-    return jsonify({"timestamp": data[-1]["timestamp"], "recommendations": recs, "profile": profile})
+    recs = recommendations.build_recommendations(
+        data[-1], profile, plants.get_ranges(profile["id"]) if profile else None
+    )
+    response = jsonify({"timestamp": data[-1]["timestamp"], "recommendations": recs, "profile": profile})
+    if RECOMMENDATIONS_CACHE_SIZE > 0:
+        with _recommendations_cache_lock:
+            _recommendations_cache[key] = response.get_data()
+            while len(_recommendations_cache) > RECOMMENDATIONS_CACHE_SIZE:
+                _recommendations_cache.popitem(last=False)
+    return _with_etag(response, etag)
+
+
+@app.get("/api/recommendations/history")
+def recommendations_history() -> Response:
+    cfg_id = request.args.get("plantConfigId")
+    plant_type = request.args.get("plantType")
+    since = request.args.get("since")
+    limit = request.args.get("limit", default=0, type=int)
+    # Sin `since` el rango llegaría hasta el principio del histórico: se acota a las últimas lecturas.
+    if not since and limit <= 0:
+        limit = HISTORY_DEFAULT_LIMIT
+    try:
+        data = storage.load_observations(
+            limit=limit,
+            plant_config_id=cfg_id,
+            plant_type=plant_type,
+            since=since,
+            until=request.args.get("until"),
+            device_id=request.args.get("deviceId"),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    default_type = plant_type or storage.load_config().get("plantType")
+    profile_ids = [item.get("plantType") or default_type for item in data]
+    ranges = {profile_id: plants.get_ranges(profile_id) for profile_id in set(profile_ids)}
+    codes = recommendations.evaluate_columns(
+        np.fromiter((item.get("temperature", 0) for item in data), dtype=np.float64, count=len(data)),
+        np.fromiter((item.get("humidity", 0) for item in data), dtype=np.float64, count=len(data)),
+        np.fromiter((item.get("illuminance", 0) for item in data), dtype=np.float64, count=len(data)),
+        profile_ids,
+        {profile_id: value for profile_id, value in ranges.items() if value is not None},
+    )
+    timestamps = []
+    for item in data:
+        try:
+            timestamps.append(timestamp_key(item.get("timestamp")))
+        except ValueError:
+            timestamps.append(timestamps[-1] if timestamps else 0.0)
+    summary = recommendations.summarize_statuses(codes, np.asarray(timestamps, dtype=np.float64))
+    summary["since"] = data[0]["timestamp"] if data else None
+    summary["until"] = data[-1]["timestamp"] if data else None
+    if request.args.get("rows", "false").lower() in ("1", "true"):
+        names = recommendations.STATUS_NAMES
+        summary["rows"] = [
+            {
+                "timestamp": item["timestamp"],
+                **{feature: names[code] for feature, code in zip(recommendations.FEATURES, row)},
+            }
+            for item, row in zip(data, codes.tolist())
+        ]
+    return jsonify(summary)
 
 
 @app.get("/")
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+# Punto de entrada ASGI opcional (`uvicorn asgi:app`). Debe fijarse antes de
+# importar app.py para que el bridge MQTT sea el de asyncio.
+os.environ["SMARTPLANT_ASGI"] = "true"
+
+from app import app as flask_app, event_broker, mqtt_bridge  # noqa: E402
+
+logger = logging.getLogger("smartplant.asgi")
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# Hilos que ejecutan las rutas Flask (ingesta, consultas, SPARQL...).
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "32"))
+# Espera máxima de un sondeo largo (`?wait=` en las rutas con ETag).
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "60"))
+LONG_POLL_PATHS = ("/api/observations/latest", "/api/recommendations/latest")
+
+
+@dataclass
+class _WSGIResponse:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    result: Iterable[bytes]
+    chunks: Iterator[bytes]
+    first: bytes
+    complete: bool
+
+
+class WSGIAdapter:
+    """Ejecuta la app Flask en un pool de hilos: todas las rutas de app.py sin duplicarlas.
+
+    El bucle sólo espera; el trabajo bloqueante (ficheros, SQLite, grafo RDF)
+    ocurre en el pool, así que una ingesta lenta no frena a los clientes SSE.
+    """
+
+    def __init__(self, wsgi_app: Callable[..., Iterable[bytes]], threads: int) -> None:
+        self.wsgi_app = wsgi_app
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi-wsgi")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        body = await _read_body(receive)
+        if body is None:
+            return
+        await self.send(send, await self.call(scope, body))
+
+    async def call(self, scope: Scope, body: bytes) -> _WSGIResponse:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._start, _environ(scope, body))
+
+    def _start(self, environ: Dict[str, Any]) -> _WSGIResponse:
+        started: List[Any] = []
+        # Lo escrito con el write() heredado de WSGI precede al iterable devuelto.
+        written: List[bytes] = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info: Any = None) -> Callable[..., None]:
+            started[:] = [status, headers]
+            return written.append
+
+        result = self.wsgi_app(environ, start_response)
+        chunks = iter(result)
+        # El primer bloque se pide aquí: algunas apps llaman a start_response al iterar.
+        first = next(chunks, b"")
+        if written:
+            first = b"".join(written) + first
+        status, headers = started
+        length = next((value for name, value in headers if name.lower() == "content-length"), None)
+        return _WSGIResponse(
+            status=int(status.split(" ", 1)[0]),
+            headers=[(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            result=result,
+            chunks=chunks,
+            first=first,
+            # Con Content-Length cubierto por el primer bloque no hace falta otro salto al pool.
+            complete=environ["REQUEST_METHOD"] == "HEAD" or (length is not None and len(first) >= int(length)),
+        )
+
+    async def send(self, send: Send, response: _WSGIResponse) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await send({"type": "http.response.start", "status": response.status, "headers": response.headers})
+            chunk: Optional[bytes] = response.first
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if response.complete:
+                    break
+                chunk = await loop.run_in_executor(self.pool, next, response.chunks, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await self.close(response)
+
+    async def close(self, response: _WSGIResponse) -> None:
+        close = getattr(response.result, "close", None)
+        if close is not None:
+            await asyncio.get_running_loop().run_in_executor(self.pool, close)
+
+
+def _environ(scope: Scope, body: bytes) -> Dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": str(client[0]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        if name == "CONTENT_LENGTH":
+            continue
+        key = name if name == "CONTENT_TYPE" else f"HTTP_{name}"
+        value = raw_value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive: Receive) -> Optional[bytes]:
+    """Cuerpo completo de la petición, o None si el cliente se desconecta antes."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _wait_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _query_arg(scope: Scope, name: str) -> str | None:
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(name)
+    return values[0] if values else None
+
+
+class SmartPlantASGI:
+    """App ASGI: SSE y sondeos largos en el bucle asyncio, el resto de rutas vía Flask.
+
+    Cada cliente de `/api/stream` o de un sondeo largo sólo ocupa una cola
+    asyncio mientras espera, no un hilo, así que un proceso atiende miles de
+    paneles y nodos a la vez. El bridge MQTT corre en el mismo bucle.
+    """
+
+    def __init__(self) -> None:
+        self.wsgi = WSGIAdapter(flask_app, WSGI_THREADS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] != "http":
+            return
+        elif scope["method"] == "GET" and scope["path"] == "/api/stream":
+            await self._stream(scope, receive, send)
+        elif scope["method"] == "GET" and scope["path"] in LONG_POLL_PATHS and _query_arg(scope, "wait"):
+            await self._long_poll(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                mqtt_bridge.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await mqtt_bridge.stop()
+                self.wsgi.pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _stream(self, scope: Scope, receive: Receive, send: Send) -> None:
+        events = event_broker.astream(
+            plant_config_id=_query_arg(scope, "plantConfigId"),
+            plant_type=_query_arg(scope, "plantType"),
+            device_id=_query_arg(scope, "deviceId"),
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream; charset=utf-8"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                    (b"access-control-allow-origin", b"*"),
+                ],
+            }
+        )
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_event.done():
+                    next_event.cancel()
+                    with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                        await next_event
+                    break
+                body = next_event.result().encode("utf-8")
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        finally:
+            disconnected.cancel()
+            await events.aclose()
+
+    async def _long_poll(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Si la respuesta sería 304, espera a la siguiente lectura (hasta `wait` s) antes de responder."""
+        try:
+            wait = min(max(float(_query_arg(scope, "wait") or 0), 0.0), LONG_POLL_MAX_SECONDS)
+        except ValueError:
+            wait = 0.0
+        # Suscrito antes de consultar: una lectura entre la consulta y la espera no se pierde.
+        subscriber = event_broker.subscribe_async()
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            response = await self.wsgi.call(scope, b"")
+            if response.status == 304 and wait > 0:
+                next_event = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+                )
+                next_event.cancel()
+                if disconnected in done:
+                    await self.wsgi.close(response)
+                    return
+                if next_event in done:
+                    await self.wsgi.close(response)
+                    response = await self.wsgi.call(scope, b"")
+        finally:
+            disconnected.cancel()
+            event_broker.unsubscribe(subscriber)
+        await self.wsgi.send(send, response)
+
+
+app = SmartPlantASGI()
@@ -0,0 +1,85 @@
+"""Tareas de mantenimiento del backend.
+
+Uso:
+    python manage.py migrate-rdf [--source data/observations.ttl] [--target data/observations.sqlite]
+    python manage.py import-observations [--source data/observations.json]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+from services import semantic_store, sqlite_storage, storage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("smartplant.manage")
+
+
+def migrate_rdf(args: argparse.Namespace) -> None:
+    count = semantic_store.migrate_turtle_to_sqlite(
+        source=Path(args.source) if args.source else None,
+        target=Path(args.target) if args.target else None,
+    )
+    logger.info("Migrados %s triples a SQLite. Arranca con RDF_BACKEND=sqlite para usarlos.", count)
+
+
+def import_observations(args: argparse.Namespace) -> None:
+    # El arranque copia observations.json al log y lo renombra a .json.migrated: si ya
+    # hay log, el .migrated está dentro y se importaría dos veces.
+    has_log = not args.source and any(storage.iter_log_observations())
+    if args.source:
+        source: Path | None = Path(args.source)
+    elif storage.OBS_FILE.exists():
+        source = storage.OBS_FILE
+    elif not has_log and storage.OBS_FILE.with_suffix(".json.migrated").exists():
+        source = storage.OBS_FILE.with_suffix(".json.migrated")
+    else:
+        source = None
+    before = sqlite_storage.count_observations()
+    imported = sqlite_storage.import_json_files(
+        source, storage.CFG_FILE, storage.PLANT_CFGS_FILE, storage.DEVICES_FILE
+    )
+    if has_log:
+        imported["observations"] += sqlite_storage.import_records(storage.iter_log_observations())
+    rows = sqlite_storage.count_observations() - before
+    if rows != imported["observations"]:
+        logger.error(
+            "Se leyeron %s observaciones pero SQLite tiene %s filas nuevas "
+            "(OBS_RETENTION_DAYS borra las antiguas al importar).",
+            imported["observations"],
+            rows,
+        )
+        raise SystemExit(1)
+    logger.info(
+        "Importadas %s observaciones, %s configuraciones guardadas y %s dispositivos a %s. "
+        "Arranca con STORAGE_BACKEND=sqlite.",
+        imported["observations"],
+        imported["plantConfigs"],
+        imported["devices"],
+        sqlite_storage.DB_FILE,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de SmartPlant")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rdf = commands.add_parser("migrate-rdf", help="Copia observations.ttl (+ journal) al backend SQLite")
+    rdf.add_argument("--source", help="Turtle de origen (por defecto data/observations.ttl)")
+    rdf.add_argument("--target", help="Base SQLite destino (por defecto data/observations.sqlite)")
+    rdf.set_defaults(func=migrate_rdf)
+
+    obs = commands.add_parser(
+        "import-observations",
+        help="Importa observations.json, el log segmentado y las configuraciones al backend SQLite",
+    )
+    obs.add_argument("--source", help="observations.json a importar (por defecto el legado y data/observations/)")
+    obs.set_defaults(func=import_observations)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
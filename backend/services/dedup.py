@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Sequence
+
+
+class DedupCache:
+    """Claves de idempotencia de las últimas lecturas aceptadas (LRU acotado).
+
+    `claim` marca como nuevas las claves no vistas y las registra en la misma
+    operación, así dos entregas simultáneas de la misma lectura (p. ej. HTTP y
+    MQTT) no pueden pasar las dos. Un LRU exacto en lugar de un filtro de Bloom:
+    un falso positivo descartaría una lectura legítima.
+    """
+
+    def __init__(self, capacity: int | None = None) -> None:
+        self.capacity = capacity if capacity is not None else int(os.getenv("INGEST_DEDUP_SIZE", "10000"))
+        self._keys: OrderedDict[str, None] = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def claim(self, keys: Sequence[Optional[str]]) -> List[bool]:
+        """True por cada clave nueva (o None); False si ya se vio, también dentro de `keys`."""
+        if not self.enabled:
+            return [True] * len(keys)
+        fresh = []
+        with self._lock:
+            for key in keys:
+                if key is None:
+                    fresh.append(True)
+                elif key in self._keys:
+                    self._keys.move_to_end(key)
+                    fresh.append(False)
+                else:
+                    self._keys[key] = None
+                    fresh.append(True)
+            while len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+        return fresh
+
+    def release(self, keys: Sequence[Optional[str]]) -> None:
+        """Olvida claves reclamadas cuya escritura falló, para que el reintento se acepte."""
+        with self._lock:
+            for key in keys:
+                if key is not None:
+                    self._keys.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
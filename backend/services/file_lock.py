@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo exclusión entre hilos del mismo proceso.
+    fcntl = None  # type: ignore[assignment]
+
+_locks: Dict[str, "FileLock"] = {}
+_locks_guard = threading.Lock()
+
+
+class FileLock:
+    """Lock exclusivo entre hilos y entre procesos (flock sobre un fichero auxiliar).
+
+    flock no excluye a hilos que comparten descriptor, por eso se combina con un
+    threading.Lock. Usar `file_lock(path)` para obtener la instancia compartida.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd: int | None = None
+        self._pid = 0
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        if fcntl is None:
+            return self
+        try:
+            # Tras un fork (gunicorn --preload) el descriptor heredado compartiría el lock.
+            if self._fd is None or self._pid != os.getpid():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        try:
+            if fcntl is not None and self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+def file_lock(path: Path) -> FileLock:
+    key = str(path)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = FileLock(path)
+        return lock
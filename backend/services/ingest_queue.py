@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import time
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger("smartplant.ingest")
+
+POLICIES = ("block", "drop-newest", "drop-oldest")
+
+
+class IngestQueue:
+    """Cola acotada con un pool de workers que agrupa lecturas antes de ingerirlas.
+
+    Los productores (callback MQTT, rutas HTTP) sólo encolan; los workers drenan
+    hasta `batch_max` lecturas y llaman a `handler` con la lista. La política
+    decide qué pasa con la cola llena: `block` espera hasta `put_timeout`,
+    `drop-newest` rechaza la lectura nueva y `drop-oldest` descarta la más antigua.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Dict[str, Any]]], None],
+        workers: int | None = None,
+        maxsize: int | None = None,
+        policy: str | None = None,
+        batch_max: int | None = None,
+        put_timeout: float | None = None,
+    ) -> None:
+        self.handler = handler
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.maxsize = maxsize or int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+        self.policy = (policy or os.getenv("INGEST_QUEUE_POLICY", "drop-oldest")).lower()
+        if self.policy not in POLICIES:
+            raise ValueError(f"Política de cola desconocida: {self.policy}")
+        self.batch_max = batch_max or int(os.getenv("INGEST_BATCH_MAX", "100"))
+        self.put_timeout = (
+            put_timeout if put_timeout is not None else float(os.getenv("INGEST_PUT_TIMEOUT", "1.0"))
+        )
+        self._queue: queue.Queue[Dict[str, Any]] = queue.Queue(maxsize=self.maxsize)
+        self._threads: List[Thread] = []
+        self._stats_lock = Lock()
+        self._busy = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+
+    def start(self) -> None:
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._threads = [
+            Thread(target=self._run, name=f"ingest-worker-{idx}", daemon=True) for idx in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info("Cola de ingesta iniciada (%s workers, capacidad %s, política %s)", self.workers, self.maxsize, self.policy)
+
+    def submit(self, payload: Dict[str, Any], policy: str | None = None) -> bool:
+        """Encola una lectura; False si la política la descartó.
+
+        `policy` sustituye a la de la cola para esta lectura. Con `drop-oldest`
+        siempre devuelve True: la descartada es otra lectura ya aceptada.
+        """
+        policy = policy or self.policy
+        try:
+            if policy == "block":
+                self._queue.put(payload, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(payload)
+        except queue.Full:
+            if policy != "drop-oldest":
+                self._count("dropped")
+                logger.warning("Cola de ingesta llena, lectura descartada")
+                return False
+            self._replace_oldest(payload)
+        self._count("enqueued")
+        return True
+
+    def submit_many(self, payloads: List[Dict[str, Any]], policy: str | None = None) -> int:
+        return sum(1 for payload in payloads if self.submit(payload, policy))
+
+    def _replace_oldest(self, payload: Dict[str, Any]) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._count("dropped")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(payload)
+                logger.warning("Cola de ingesta llena, se descartó la lectura más antigua")
+                return
+            except queue.Full:
+                continue
+
+    def _count(self, field: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + amount)
+            depth = self._queue.qsize()
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._stats_lock:
+                self._busy += 1
+            try:
+                self.handler(batch)
+                self._count("processed", len(batch))
+            except Exception:
+                self._count("failed", len(batch))
+                logger.exception("Error procesando lote de la cola de ingesta")
+            finally:
+                with self._stats_lock:
+                    self._busy -= 1
+                for _ in batch:
+                    self._queue.task_done()
+
+    def wait_idle(self, timeout: float = 5.0) -> bool:
+        """Espera a que la cola se vacíe y no haya lotes en curso."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._stats_lock:
+                if self._queue.unfinished_tasks == 0 and self._busy == 0:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self.maxsize,
+                "maxDepth": self.max_depth,
+                "workers": self.workers,
+                "busyWorkers": self._busy,
+                "policy": self.policy,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import queue
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+logger = logging.getLogger("smartplant.live")
+
+KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+
+
+class AsyncSubscriber:
+    """Suscriptor para el bucle asyncio (asgi.py): `publish` se llama desde hilos de ingesta."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue(maxsize)
+
+    def put_nowait(self, message: Dict[str, Any]) -> None:
+        if self.queue.full():
+            raise queue.Full
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.debug("Cliente SSE lento, evento %s descartado", message["id"])
+
+
+def _render(
+    message: Dict[str, Any], plant_config_id: str | None, plant_type: str | None, device_id: str | None
+) -> str | None:
+    """Mensaje text/event-stream del evento, o None si no pasa los filtros del cliente."""
+    observation = message["data"].get("observation", {})
+    if plant_config_id and observation.get("plantConfigId") != plant_config_id:
+        return None
+    if plant_type and observation.get("plantType") != plant_type:
+        return None
+    if device_id and observation.get("deviceId") != device_id:
+        return None
+    payload = json.dumps(message["data"], ensure_ascii=False, separators=(",", ":"))
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {payload}\n\n"
+
+
+class EventBroker:
+    """Difunde eventos de ingesta a los clientes SSE conectados.
+
+    Cada suscriptor tiene su propia cola acotada; si un cliente lento la llena
+    se descartan sus eventos en lugar de frenar la ingesta. El broker es local
+    al proceso: sólo difunde lo que ingiere este worker.
+    """
+
+    def __init__(self, queue_size: int | None = None) -> None:
+        self.queue_size = queue_size or SUBSCRIBER_QUEUE_SIZE
+        self._subscribers: List[queue.Queue[Dict[str, Any]] | AsyncSubscriber] = []
+        self._lock = Lock()
+        self.event_id = 0
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self.event_id += 1
+            message = {"id": self.event_id, "event": event, "data": data}
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                logger.debug("Cliente SSE lento, evento %s descartado", message["id"])
+
+    def subscribe(self) -> queue.Queue[Dict[str, Any]]:
+        subscriber: queue.Queue[Dict[str, Any]] = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def subscribe_async(self) -> AsyncSubscriber:
+        """Como `subscribe`, pero la cola se consume con await desde el bucle en curso."""
+        subscriber = AsyncSubscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue[Dict[str, Any]] | AsyncSubscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(
+        self,
+        plant_config_id: str | None = None,
+        plant_type: str | None = None,
+        device_id: str | None = None,
+        keepalive: float | None = None,
+    ) -> Iterator[str]:
+        """Generador de mensajes en formato text/event-stream."""
+        subscriber = self.subscribe()
+        timeout = keepalive or KEEPALIVE_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=timeout)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                text = _render(message, plant_config_id, plant_type, device_id)
+                if text is not None:
+                    yield text
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def astream(
+        self,
+        plant_config_id: str | None = None,
+        plant_type: str | None = None,
+        device_id: str | None = None,
+        keepalive: float | None = None,
+    ) -> AsyncIterator[str]:
+        """Versión asyncio de `stream`: cada cliente cuesta una cola, no un hilo."""
+        subscriber = self.subscribe_async()
+        timeout = keepalive or KEEPALIVE_SECONDS
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                text = _render(message, plant_config_id, plant_type, device_id)
+                if text is not None:
+                    yield text
+        finally:
+            self.unsubscribe(subscriber)
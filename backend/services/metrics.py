@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Con METRICS_ENABLED=false los contadores e histogramas no registran nada.
+ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+LabelValues = Tuple[str, ...]
+# Un callback de gauge devuelve un valor o {valores de etiquetas: valor}.
+GaugeCallback = Callable[[], "float | Dict[LabelValues, float]"]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histograma con buckets fijos; se guardan cuentas por bucket y se acumulan al exportar."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [cuentas por bucket (+Inf al final), suma, total].
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = tuple(labels[name] for name in self.labels)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            entry[0][position] += 1
+            entry[1][0] += value
+            entry[1][1] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), list(totals)) for key, (counts, totals) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, (total, count)) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            label_text = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {int(count)}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class StageTimer:
+    """Mide etapas consecutivas: cada `lap(etapa)` registra el tiempo desde la anterior."""
+
+    def __init__(self, histogram: Histogram, **labels: str) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.started = self.last = time.perf_counter() if ENABLED else 0.0
+
+    def lap(self, stage: str) -> None:
+        if not ENABLED:
+            return
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, stage=stage, **self.labels)
+        self.last = now
+
+    def total(self, stage: str = "total") -> None:
+        if ENABLED:
+            self.histogram.observe(time.perf_counter() - self.started, stage=stage, **self.labels)
+
+
+class Gauge:
+    """Valor calculado en el momento de exportar (sin coste mientras nadie consulta /api/metrics)."""
+
+    def __init__(self, name: str, help_text: str, callback: GaugeCallback, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception:
+            # Un gauge que falla (p. ej. fichero aún no creado) no debe romper el scrape.
+            return lines
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(item)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Counter | Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Counter | Histogram | Gauge) -> None:
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._register(metric)
+        return metric
+
+    def histogram(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._register(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, callback: GaugeCallback, labels: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, help_text, callback, labels)
+        self._register(metric)
+        return metric
+
+    def render(self) -> str:
+        """Texto en formato de exposición de Prometheus (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -1,29 +1,82 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import json
 import logging
 import os
-from threading import Thread
-from typing import Callable, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock, Thread, Timer, get_ident
+from typing import IO, Callable, Dict, Any, List, Optional
 from uuid import uuid4
 
 from paho.mqtt import client as mqtt
 
+from services import uplink
+from services.metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, cada proceso se considera líder.
+    fcntl = None  # type: ignore[assignment]
+
 logger = logging.getLogger("smartplant.mqtt")
 
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+MESSAGES_TOTAL = REGISTRY.counter(
+    "smartplant_mqtt_messages_total", "Mensajes MQTT recibidos por resultado", ("result",)
+)
+READINGS_TOTAL = REGISTRY.counter("smartplant_mqtt_readings_total", "Lecturas recibidas por MQTT")
+PAYLOAD_BYTES_TOTAL = REGISTRY.counter(
+    "smartplant_mqtt_payload_bytes_total", "Bytes de payload MQTT recibidos por formato", ("format",)
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    "smartplant_mqtt_handler_seconds", "Tiempo en el handler de cada mensaje o lote MQTT", ("kind",)
+)
+CONNECTIONS_TOTAL = REGISTRY.counter(
+    "smartplant_mqtt_connections_total", "Intentos de conexión al broker por resultado", ("result",)
+)
+
 
 class MQTTBridge:
-    def __init__(self, handler: Callable[[Dict[str, Any]], None]) -> None:
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], None],
+        batch_handler: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> None:
         self.handler = handler
+        self.batch_handler = batch_handler
         self.enabled = os.getenv("MQTT_ENABLED", "true").lower() != "false"
         self.host = os.getenv("MQTT_BROKER_HOST", "localhost")
         self.port = int(os.getenv("MQTT_BROKER_PORT", "1883"))
         self.topic = os.getenv("MQTT_TOPIC", "smartplant/observations")
+        # Topic por dispositivo: el nivel "+" es el deviceId (vacío = desactivado).
+        self.device_topic = os.getenv("MQTT_DEVICE_TOPIC", "smartplant/+/observations")
+        levels = self.device_topic.split("/")
+        self._device_level = levels.index("+") if "+" in levels else None
         self.username = os.getenv("MQTT_USERNAME", "")
         self.password = os.getenv("MQTT_PASSWORD", "")
         self.client_id = os.getenv("MQTT_CLIENT_ID", f"smartplant-backend-{uuid4().hex[:6]}")
+        # Micro-batching: se agrupan hasta MQTT_BATCH_SIZE mensajes o los recibidos
+        # en MQTT_BATCH_WINDOW_MS antes de llamar a batch_handler (1 = desactivado).
+        self.batch_size = max(int(os.getenv("MQTT_BATCH_SIZE", "1")), 1)
+        self.batch_window = float(os.getenv("MQTT_BATCH_WINDOW_MS", "500")) / 1000
         self._client: mqtt.Client | None = None
         self._thread: Thread | None = None
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = Lock()
+        self._flush_timer: Timer | None = None
+        # Con varios workers (gunicorn) sólo el que obtiene el lock se suscribe;
+        # el resto reintenta cada MQTT_LEADER_RETRY_SECONDS por si el líder cae.
+        self.single_leader = os.getenv("MQTT_SINGLE_LEADER", "true").lower() != "false"
+        self.leader_lock_path = Path(os.getenv("MQTT_LEADER_LOCK", str(DATA_DIR / "mqtt.leader.lock")))
+        self.leader_retry = float(os.getenv("MQTT_LEADER_RETRY_SECONDS", "10"))
+        self.is_leader = False
+        self.connected = False
+        self._leader_fh: IO[str] | None = None
 
     def start(self) -> None:
         if not self.enabled:
@@ -35,37 +88,271 @@ class MQTTBridge:
         self._thread.start()
         logger.info("MQTT bridge thread started")
 
+    def _acquire_leadership(self) -> bool:
+        if not self.single_leader or fcntl is None:
+            return True
+        self.leader_lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fh = self.leader_lock_path.open("a+", encoding="utf-8")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+        # El lock se libera al terminar el proceso o el hilo del bridge.
+        self._leader_fh = fh
+        return True
+
+    def _release_leadership(self) -> None:
+        """Suelta el lock de líder para que otro worker pueda consumir MQTT."""
+        self.is_leader = False
+        if self._leader_fh is not None:
+            self._leader_fh.close()
+            self._leader_fh = None
+
     def _run(self) -> None:
-        self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id)
-        if self.username:
-            self._client.username_pw_set(self.username, self.password or None)
-        self._client.on_connect = self._on_connect
-        self._client.on_message = self._on_message
-        self._client.connect(self.host, self.port, keepalive=60)
+        waiting_logged = False
+        while not self._acquire_leadership():
+            if not waiting_logged:
+                logger.info("Otro worker consume MQTT; este proceso queda a la espera (pid %s)", os.getpid())
+                waiting_logged = True
+            time.sleep(self.leader_retry)
+        self.is_leader = True
+        logger.info("Proceso %s es el consumidor MQTT", os.getpid())
         try:
+            self._client = self._create_client()
+            # Tras la primera conexión, loop_forever reconecta solo; ésta se reintenta
+            # aquí con backoff exponencial hasta 60 s, como en AsyncMQTTBridge.
+            delay = 1.0
+            while True:
+                try:
+                    self._client.connect(self.host, self.port, keepalive=60)
+                    break
+                except OSError as exc:
+                    CONNECTIONS_TOTAL.inc(result="error")
+                    logger.warning(
+                        "No se pudo conectar a MQTT %s:%s (%s), reintento en %.0f s", self.host, self.port, exc, delay
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
             self._client.loop_forever()
         except KeyboardInterrupt:
             pass
+        finally:
+            # Si el hilo termina (p. ej. un error inesperado), otro worker toma el relevo.
+            self._release_leadership()
+
+    def _create_client(self) -> mqtt.Client:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id)
+        if self.username:
+            client.username_pw_set(self.username, self.password or None)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.on_disconnect = self._on_disconnect
+        return client
 
     def _on_connect(self, client: mqtt.Client, userdata: Any, flags: dict, reason_code: int, properties: Any) -> None:
+        CONNECTIONS_TOTAL.inc(result="ok" if reason_code == 0 else "error")
+        self.connected = reason_code == 0
         if reason_code == 0:
-            logger.info("MQTT conectado a %s:%s, suscribiendo a %s", self.host, self.port, self.topic)
-            client.subscribe(self.topic)
+            # Cada tópico JSON tiene su variante <tópico>/bin con el formato binario (services/uplink.py).
+            topics = [
+                topic + suffix
+                for topic in (self.topic, self.device_topic)
+                if topic
+                for suffix in ("", uplink.MQTT_TOPIC_SUFFIX)
+            ]
+            logger.info("MQTT conectado a %s:%s, suscribiendo a %s", self.host, self.port, ", ".join(topics))
+            client.subscribe([(topic, 0) for topic in topics])
         else:
             logger.error("Conexión MQTT fallida, code=%s", reason_code)
 
+    def _on_disconnect(
+        self, client: mqtt.Client, userdata: Any, flags: Any, reason_code: Any, properties: Any
+    ) -> None:
+        self.connected = False
+        logger.warning("MQTT desconectado (code=%s)", reason_code)
+
     def _on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
+        topic = msg.topic
+        binary = topic.endswith(uplink.MQTT_TOPIC_SUFFIX)
+        if binary:
+            topic = topic[: -len(uplink.MQTT_TOPIC_SUFFIX)]
+        PAYLOAD_BYTES_TOTAL.inc(len(msg.payload), format="binary" if binary else "json")
         try:
-            payload = json.loads(msg.payload.decode("utf-8"))
-        except json.JSONDecodeError:
-            logger.warning("Mensaje MQTT inválido (no JSON)")
+            payload = uplink.decode(msg.payload) if binary else json.loads(msg.payload.decode("utf-8"))
+        except ValueError as exc:
+            MESSAGES_TOTAL.inc(result="invalid")
+            logger.warning("Mensaje MQTT inválido en %s: %s", msg.topic, exc)
+            return
+
+        # Un mensaje puede traer varias lecturas (p. ej. al vaciar el backlog del nodo).
+        payloads = payload if isinstance(payload, list) else [payload]
+        device_id = self.device_from_topic(topic)
+        if device_id:
+            for item in payloads:
+                if isinstance(item, dict):
+                    item["deviceId"] = device_id
+        READINGS_TOTAL.inc(len(payloads))
+        if self.batch_handler is not None and (self.batch_size > 1 or len(payloads) > 1):
+            MESSAGES_TOTAL.inc(result="ok")
+            self._enqueue(payloads)
             return
 
         try:
-            self.handler(payload)
+            with HANDLER_SECONDS.time(kind="message"):
+                self.handler(payloads[0])
+            MESSAGES_TOTAL.inc(result="ok")
             logger.info("Observación MQTT procesada")
         except Exception:
+            MESSAGES_TOTAL.inc(result="error")
             logger.exception("No se pudo procesar mensaje MQTT")
 
+    def device_from_topic(self, topic: str) -> str | None:
+        """deviceId del nivel "+" de MQTT_DEVICE_TOPIC, o None si el topic no es de dispositivo."""
+        if self._device_level is None or not mqtt.topic_matches_sub(self.device_topic, topic):
+            return None
+        return topic.split("/")[self._device_level] or None
+
+    def _enqueue(self, payloads: List[Dict[str, Any]]) -> None:
+        with self._pending_lock:
+            self._pending.extend(payloads)
+            if len(self._pending) < self.batch_size:
+                if self._flush_timer is None:
+                    self._flush_timer = Timer(self.batch_window, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Entrega al batch_handler los mensajes acumulados."""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if not batch or self.batch_handler is None:
+            return
+        try:
+            with HANDLER_SECONDS.time(kind="batch"):
+                self.batch_handler(batch)
+            logger.info("Lote MQTT de %s mensajes procesado", len(batch))
+        except Exception:
+            MESSAGES_TOTAL.inc(result="error")
+            logger.exception("No se pudo procesar lote MQTT")
+
+
+class AsyncMQTTBridge(MQTTBridge):
+    """El mismo bridge atendido desde un bucle asyncio (asgi.py), sin hilo de red.
+
+    El socket de paho se registra en el bucle con add_reader/add_writer y
+    `loop_misc` (keepalive) corre en una tarea; la reconexión usa backoff
+    exponencial hasta 60 s. `handler` y `batch_handler` se ejecutan en un hilo
+    aparte, en orden de llegada, para que una ingesta lenta no bloquee el bucle.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], None],
+        batch_handler: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> None:
+        self._handler_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mqtt-handler")
+        super().__init__(
+            self._offload(handler), self._offload(batch_handler) if batch_handler is not None else None
+        )
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        """Lanza la tarea del bridge en el bucle en curso."""
+        if not self.enabled:
+            logger.info("MQTT bridge disabled (set MQTT_ENABLED=true to enable)")
+            return
+        if self._task and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = get_ident()
+        self._task = self._loop.create_task(self._run_async())
+        logger.info("MQTT bridge asyncio iniciado")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        if self._client is not None:
+            self._client.disconnect()
+        self.connected = False
+        self.flush()
+        self._handler_pool.shutdown(wait=True)
+
+    def _offload(self, handler: Callable[[Any], None]) -> Callable[[Any], None]:
+        def run(payload: Any) -> None:
+            try:
+                handler(payload)
+            except Exception:
+                MESSAGES_TOTAL.inc(result="error")
+                logger.exception("No se pudo procesar mensaje MQTT")
+
+        def submit(payload: Any) -> None:
+            self._handler_pool.submit(run, payload)
+
+        return submit
+
+    async def _run_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        waiting_logged = False
+        while not self._acquire_leadership():
+            if not waiting_logged:
+                logger.info("Otro worker consume MQTT; este proceso queda a la espera (pid %s)", os.getpid())
+                waiting_logged = True
+            await asyncio.sleep(self.leader_retry)
+        self.is_leader = True
+        logger.info("Proceso %s es el consumidor MQTT", os.getpid())
+        client = self._client = self._create_client()
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+        delay = 1.0
+        while True:
+            try:
+                # connect resuelve el host y abre el TCP de forma bloqueante.
+                await loop.run_in_executor(None, client.connect, self.host, self.port, 60)
+            except OSError as exc:
+                CONNECTIONS_TOTAL.inc(result="error")
+                logger.warning(
+                    "No se pudo conectar a MQTT %s:%s (%s), reintento en %.0f s", self.host, self.port, exc, delay
+                )
+            else:
+                delay = 1.0
+                while client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                    await asyncio.sleep(1)
+            self.connected = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    # paho llama a estos callbacks desde el bucle o, al abrir el socket, desde el executor
+    # de connect. En el bucle se aplican en el acto: paho cierra el socket justo después.
+    def _schedule(self, callback: Callable[..., Any], *args: Any) -> None:
+        if get_ident() == self._loop_thread:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)  # type: ignore[union-attr]
+
+    def _on_socket_open(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        self._schedule(self._loop.add_reader, sock.fileno(), client.loop_read)  # type: ignore[union-attr]
+
+    def _on_socket_close(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        self._schedule(self._loop.remove_reader, sock.fileno())  # type: ignore[union-attr]
 
+    def _on_socket_register_write(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        self._schedule(self._loop.add_writer, sock.fileno(), client.loop_write)  # type: ignore[union-attr]
 
+    def _on_socket_unregister_write(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        self._schedule(self._loop.remove_writer, sock.fileno())  # type: ignore[union-attr]
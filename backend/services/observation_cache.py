@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def timestamp_key(value: Any) -> float:
+    """Convierte un timestamp ISO 8601 en segundos epoch (UTC si no trae zona)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        raise ValueError("Timestamp inválido")
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Timestamp inválido: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class RingBuffer:
+    """Últimas `capacity` observaciones de una clave, ordenadas por timestamp."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.keys: List[float] = []
+        self.items: List[Dict[str, Any]] = []
+        # True si alguna observación de esta clave ya no está en memoria.
+        self.truncated = False
+
+    def add(self, key: float, item: Dict[str, Any]) -> None:
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.items.append(item)
+        else:
+            pos = bisect_right(self.keys, key)
+            self.keys.insert(pos, key)
+            self.items.insert(pos, item)
+        # Recorte por bloques para que el coste amortizado siga siendo O(1).
+        if len(self.keys) > self.capacity + max(self.capacity // 4, 1):
+            excess = len(self.keys) - self.capacity
+            del self.keys[:excess]
+            del self.items[:excess]
+            self.truncated = True
+
+    def oldest(self) -> Optional[float]:
+        return self.keys[0] if self.keys else None
+
+    def window(self, since: Optional[float], until: Optional[float]) -> Iterable[Dict[str, Any]]:
+        """Itera (de más reciente a más antigua) las observaciones en [since, until]."""
+        start = bisect_left(self.keys, since) if since is not None else 0
+        end = bisect_right(self.keys, until) if until is not None else len(self.keys)
+        for idx in range(end - 1, start - 1, -1):
+            yield self.items[idx]
+
+
+class ObservationIndex:
+    """Índice en memoria de observaciones por plantConfigId, plantType y deviceId."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.all = RingBuffer(capacity)
+        self.by_config: Dict[str, RingBuffer] = {}
+        self.by_type: Dict[str, RingBuffer] = {}
+        self.by_device: Dict[str, RingBuffer] = {}
+
+    def add(self, item: Dict[str, Any]) -> None:
+        try:
+            key = timestamp_key(item.get("timestamp"))
+        except ValueError:
+            key = self.all.keys[-1] if self.all.keys else 0.0
+        self.all.add(key, item)
+        cfg_id = item.get("plantConfigId")
+        if cfg_id:
+            self.by_config.setdefault(cfg_id, RingBuffer(self.capacity)).add(key, item)
+        plant_type = item.get("plantType")
+        if plant_type:
+            self.by_type.setdefault(plant_type, RingBuffer(self.capacity)).add(key, item)
+        device_id = item.get("deviceId")
+        if device_id:
+            self.by_device.setdefault(device_id, RingBuffer(self.capacity)).add(key, item)
+
+    def query(
+        self,
+        limit: int | None,
+        plant_config_id: str | None,
+        plant_type: str | None,
+        since: float | None,
+        until: float | None,
+        device_id: str | None = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Resuelve la consulta desde memoria; None si hace falta ir a disco."""
+        if device_id:
+            buffer = self.by_device.get(device_id)
+        elif plant_config_id:
+            buffer = self.by_config.get(plant_config_id)
+        elif plant_type:
+            buffer = self.by_type.get(plant_type)
+        else:
+            buffer = self.all
+        if buffer is None:
+            return []
+
+        data: List[Dict[str, Any]] = []
+        for item in buffer.window(since, until):
+            if device_id and plant_config_id and item.get("plantConfigId") != plant_config_id:
+                continue
+            if (device_id or plant_config_id) and plant_type and item.get("plantType") != plant_type:
+                continue
+            data.append(item)
+            if limit and len(data) >= limit:
+                break
+
+        if buffer.truncated:
+            complete = bool(limit) and len(data) >= limit
+            oldest = buffer.oldest()
+            # Lo expulsado tiene timestamp <= oldest, así que sólo since > oldest lo excluye.
+            if not complete and not (since is not None and oldest is not None and since > oldest):
+                return None
+        data.reverse()
+        return data
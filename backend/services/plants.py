@@ -1,12 +1,36 @@
 from __future__ import annotations
 
 import json
-from functools import lru_cache
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from services.recommendations import RangeTuple, compile_ranges
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 PLANT_FILE = DATA_DIR / "plants.json"
+# Cada cuántos segundos se comprueba si plants.json cambió en disco (0 = nunca).
+CHECK_INTERVAL = float(os.getenv("PLANTS_CHECK_INTERVAL", "5"))
+
+logger = logging.getLogger("smartplant.plants")
+
+
+@dataclass(frozen=True)
+class PlantRegistry:
+    plants: List[Dict[str, Any]]
+    by_id: Dict[str, Dict[str, Any]]
+    ranges: Dict[str, RangeTuple]
+    mtime_ns: int
+    version: int
+
+
+_registry: PlantRegistry | None = None
+_reload_lock = threading.Lock()
+_checked_at = 0.0
 
 
 def _read_plants() -> List[Dict[str, Any]]:
@@ -17,20 +41,77 @@ def _read_plants() -> List[Dict[str, Any]]:
     return json.loads(PLANT_FILE.read_text(encoding="utf-8"))
 
 
-@lru_cache(maxsize=1)
+def _build_registry(version: int) -> PlantRegistry:
+    mtime_ns = PLANT_FILE.stat().st_mtime_ns if PLANT_FILE.exists() else 0
+    plants = _read_plants()
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for plant in plants:
+        by_id.setdefault(plant["id"], plant)
+    return PlantRegistry(
+        plants=plants,
+        by_id=by_id,
+        ranges={plant_id: compile_ranges(plant) for plant_id, plant in by_id.items()},
+        mtime_ns=mtime_ns,
+        version=version,
+    )
+
+
+def reload() -> PlantRegistry:
+    """Relee plants.json y sustituye el registro de forma atómica.
+
+    Los lectores siguen usando el registro anterior hasta que termina la carga;
+    si el fichero es inválido se conserva el registro vigente.
+    """
+    global _registry, _checked_at
+    with _reload_lock:
+        version = _registry.version + 1 if _registry else 1
+        _registry = _build_registry(version)
+        _checked_at = time.monotonic()
+        logger.info("Catálogo de plantas cargado (%s perfiles, versión %s)", len(_registry.plants), version)
+        return _registry
+
+
+def _current() -> PlantRegistry:
+    global _checked_at
+    registry = _registry
+    if registry is None:
+        return reload()
+    now = time.monotonic()
+    if CHECK_INTERVAL and now - _checked_at >= CHECK_INTERVAL:
+        _checked_at = now
+        try:
+            changed = PLANT_FILE.stat().st_mtime_ns != registry.mtime_ns
+        except FileNotFoundError:
+            changed = False
+        if changed:
+            try:
+                return reload()
+            except (ValueError, KeyError, TypeError):
+                logger.exception("plants.json inválido, se mantiene la versión %s", registry.version)
+    return registry
+
+
 def get_plants() -> List[Dict[str, Any]]:
-    return _read_plants()
+    return _current().plants
+
+
+def get_version() -> int:
+    return _current().version
 
 
 def get_profile(plant_id: Optional[str]) -> Optional[Dict[str, Any]]:
-    plants = get_plants()
-    if not plants:
+    registry = _current()
+    if not registry.plants:
         return None
 
     if plant_id:
-        for plant in plants:
-            if plant["id"] == plant_id:
-                return plant
-        return None
-    return plants[0]
+        return registry.by_id.get(plant_id)
+    return registry.plants[0]
 
+
+def get_ranges(plant_id: Optional[str]) -> Optional[RangeTuple]:
+    """Rangos precompilados ((min, max) de temperatura, humedad y luz) del perfil."""
+    profile = get_profile(plant_id)
+    if profile is None:
+        return None
+    return _current().ranges.get(profile["id"])
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Mapping, Sequence, Tuple, Optional
+
+import numpy as np
 
 DEFAULT_RANGES = {
     "temperature": {"min": 18, "max": 28},
@@ -27,6 +29,12 @@ MESSAGES = {
 }
 
 
+FEATURES = ("temperature", "humidity", "light")
+STATUS_NAMES = {-1: "low", 0: "ok", 1: "high"}
+
+RangeTuple = Tuple[Tuple[float, float], Tuple[float, float], Tuple[float, float]]
+
+
 def _eval_range(value: float, low: float, high: float) -> int:
     """Return -1 if low, 1 if high, 0 if ok."""
     if value < low:
@@ -49,45 +57,24 @@ def _select_range(profile: Optional[Dict[str, Any]], key: str) -> Dict[str, floa
     return ranges.get(key, DEFAULT_RANGES.get(key, DEFAULT_RANGES["temperature"]))
 
 
-def build_recommendations(
-    payload: Dict[str, float],
-    profile: Optional[Dict[str, Any]] = None,
-) -> Dict[str, List[Dict[str, str]]]:
-    temperature = float(payload.get("temperature", 0))
-    humidity = float(payload.get("humidity", 0))
-    light = float(payload.get("illuminance", payload.get("light", 0)))
+def compile_ranges(profile: Optional[Dict[str, Any]]) -> RangeTuple:
+    """Rangos (min, max) de temperatura, humedad y luz, con los valores por defecto aplicados."""
+    compiled = []
+    for key in ("temperature", "humidity", "illuminance"):
+        selected = _select_range(profile, key)
+        compiled.append((float(selected["min"]), float(selected["max"])))
+    return tuple(compiled)  # type: ignore[return-value]
 
-    temp_range = _select_range(profile, "temperature")
-    hum_range = _select_range(profile, "humidity")
-    light_range = _select_range(profile, "illuminance")
 
-    evaluations = [
-        (
-            "temperature",
-            _status_map(
-                _eval_range(temperature, temp_range["min"], temp_range["max"]),
-                *MESSAGES["temperature"],
-            ),
-        ),
-        (
-            "humidity",
-            _status_map(
-                _eval_range(humidity, hum_range["min"], hum_range["max"]),
-                *MESSAGES["humidity"],
-            ),
-        ),
-        (
-            "light",
-            _status_map(
-                _eval_range(light, light_range["min"], light_range["max"]),
-                *MESSAGES["light"],
-            ),
-        ),
-    ]
+# Resultado por combinación de estados (-1/0/1 por característica): como mucho 27 entradas.
+_RESULTS: Dict[Tuple[int, int, int], Dict[str, Any]] = {}
+
 
+def _build_result(codes: Tuple[int, int, int]) -> Dict[str, Any]:
     tips = []
     alerts = []
-    for feature, (status, message) in evaluations:
+    for feature, code in zip(FEATURES, codes):
+        status, message = _status_map(code, *MESSAGES[feature])
         entry = {"feature": feature, "status": status, "message": message}
         if status == "ok":
             tips.append(entry)
@@ -97,3 +84,98 @@ def build_recommendations(
     overall = "alert" if alerts else "ok"
     return {"status": overall, "alerts": alerts, "tips": tips}
 
+
+def build_recommendations(
+    payload: Dict[str, float],
+    profile: Optional[Dict[str, Any]] = None,
+    ranges: Optional[RangeTuple] = None,
+) -> Dict[str, List[Dict[str, str]]]:
+    """Recomendaciones de una lectura.
+
+    El resultado sólo depende del estado de cada característica, así que se
+    memoiza por esos estados; cada llamada recibe su propia copia.
+    """
+    temperature = float(payload.get("temperature", 0))
+    humidity = float(payload.get("humidity", 0))
+    light = float(payload.get("illuminance", payload.get("light", 0)))
+
+    temp_range, hum_range, light_range = ranges or compile_ranges(profile)
+    codes = (
+        _eval_range(temperature, *temp_range),
+        _eval_range(humidity, *hum_range),
+        _eval_range(light, *light_range),
+    )
+    result = _RESULTS.get(codes)
+    if result is None:
+        result = _RESULTS[codes] = _build_result(codes)
+    return {
+        "status": result["status"],
+        "alerts": [dict(entry) for entry in result["alerts"]],
+        "tips": [dict(entry) for entry in result["tips"]],
+    }
+
+
+def evaluate_columns(
+    temperature: np.ndarray,
+    humidity: np.ndarray,
+    illuminance: np.ndarray,
+    profile_ids: Sequence[str],
+    ranges_by_profile: Mapping[str, RangeTuple],
+) -> np.ndarray:
+    """Evalúa un bloque columnar de lecturas en una sola pasada vectorizada.
+
+    Devuelve una matriz int8 (n, 3) con -1 (bajo), 0 (ok) o 1 (alto) por fila y
+    por característica, en el orden de FEATURES. Los perfiles sin rangos en
+    `ranges_by_profile` usan DEFAULT_RANGES.
+    """
+    values = np.column_stack(
+        (
+            np.asarray(temperature, dtype=np.float64),
+            np.asarray(humidity, dtype=np.float64),
+            np.asarray(illuminance, dtype=np.float64),
+        )
+    )
+    if not len(values):
+        return np.zeros((0, len(FEATURES)), dtype=np.int8)
+
+    unique_ids, inverse = np.unique(np.asarray(profile_ids, dtype=object).astype(str), return_inverse=True)
+    bounds = np.array(
+        [ranges_by_profile.get(profile_id) or compile_ranges(None) for profile_id in unique_ids],
+        dtype=np.float64,
+    )
+    low = bounds[inverse, :, 0]
+    high = bounds[inverse, :, 1]
+    return (values > high).astype(np.int8) - (values < low).astype(np.int8)
+
+
+def summarize_statuses(codes: np.ndarray, timestamps: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Conteos por estado, lecturas con alerta y fracción de tiempo dentro de rango.
+
+    Con `timestamps` (segundos epoch, ordenados) cada lectura pesa el tiempo hasta
+    la siguiente; sin ellos, todas pesan lo mismo.
+    """
+    rows = len(codes)
+    if timestamps is not None and rows > 1:
+        weights = np.diff(np.asarray(timestamps, dtype=np.float64), append=timestamps[-1])
+        weights = np.clip(weights, 0, None)
+        if not weights.any():
+            weights = np.ones(rows)
+    else:
+        weights = np.ones(rows)
+    total_weight = float(weights.sum()) or 1.0
+
+    features = {}
+    for column, feature in enumerate(FEATURES):
+        feature_codes = codes[:, column]
+        in_range = feature_codes == 0
+        features[feature] = {
+            "low": int(np.count_nonzero(feature_codes < 0)),
+            "ok": int(np.count_nonzero(in_range)),
+            "high": int(np.count_nonzero(feature_codes > 0)),
+            "timeInRange": round(float(weights[in_range].sum()) / total_weight, 4) if rows else None,
+        }
+    return {
+        "count": rows,
+        "alerts": int(np.count_nonzero(codes.any(axis=1))) if rows else 0,
+        "features": features,
+    }
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from services.observation_cache import timestamp_key
+
+BUCKETS = {"1m": 60, "1h": 3600, "1d": 86400}
+# Cuánto historial se conserva por tamaño de bucket (None = sin límite).
+RETENTION = {"1m": 7 * 86400, "1h": 400 * 86400, "1d": None}
+# Ventana por defecto si la consulta no trae `since`.
+DEFAULT_WINDOW = {"1m": 6 * 3600, "1h": 7 * 86400, "1d": 90 * 86400}
+MAX_POINTS = 5000
+MEASUREMENTS = ("temperature", "humidity", "illuminance")
+
+# [count, sum, min, max] por medida.
+Stats = List[List[float]]
+SeriesKey = Tuple[str, str, str]
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class RollupIndex:
+    """Agregados min/max/media/count por bucket, actualizados lectura a lectura.
+
+    Se mantienen series para todas las lecturas, por plantConfigId, por
+    plantType y por deviceId. Una consulta recorre sólo los buckets del rango pedido, así el
+    tamaño de la respuesta no depende del volumen de datos crudos.
+    Las lecturas nuevas se incorporan con `sync` antes de cada consulta. Los
+    buckets más antiguos que RETENTION no se crean ni se conservan.
+    """
+
+    def __init__(self) -> None:
+        self._series: Dict[SeriesKey, Dict[int, Stats]] = {}
+        self._lock = threading.Lock()
+        self._cursor: Any = None
+        # Primer bucket conservado por tamaño; se poda cuando avanza.
+        self._horizon: Dict[str, int] = {}
+
+    def sync(self, reader: Callable[[Any], Tuple[List[Dict[str, Any]], Any, bool]]) -> None:
+        """Incorpora las lecturas almacenadas desde la última sincronización.
+
+        `reader` es `storage.read_changes`: la primera vez recorre todo el
+        histórico y después sólo lo nuevo, venga de este proceso o de otro worker.
+        """
+        with self._lock:
+            records, cursor, reset = reader(self._cursor)
+            if reset:
+                self._series = {}
+                self._horizon = {}
+            horizon = self._compute_horizon(time.time())
+            if horizon != self._horizon:
+                self._prune_locked(horizon)
+            for record in records:
+                self._add_locked(record, horizon)
+            self._cursor = cursor
+
+    @staticmethod
+    def _compute_horizon(now: float) -> Dict[str, int]:
+        """Inicio del bucket más antiguo que se conserva, por tamaño con retención."""
+        return {
+            bucket: int((now - RETENTION[bucket]) // size * size)
+            for bucket, size in BUCKETS.items()
+            if RETENTION[bucket] is not None
+        }
+
+    def _add_locked(self, record: Dict[str, Any], horizon: Dict[str, int]) -> None:
+        try:
+            ts = timestamp_key(record.get("timestamp"))
+        except ValueError:
+            return
+        values = []
+        for measurement in MEASUREMENTS:
+            value = record.get(measurement)
+            values.append(float(value) if isinstance(value, (int, float)) else None)
+
+        dimensions = [("all", "")]
+        if record.get("plantConfigId"):
+            dimensions.append(("config", record["plantConfigId"]))
+        if record.get("plantType"):
+            dimensions.append(("type", record["plantType"]))
+        if record.get("deviceId"):
+            dimensions.append(("device", record["deviceId"]))
+
+        for bucket, size in BUCKETS.items():
+            start = int(ts // size * size)
+            if start < horizon.get(bucket, start):
+                # Fuera de la retención: la primera sincronización no lo carga en memoria.
+                continue
+            for dimension, key in dimensions:
+                series = self._series.setdefault((bucket, dimension, key), {})
+                stats = series.get(start)
+                if stats is None:
+                    stats = series[start] = [[0, 0.0, float("inf"), float("-inf")] for _ in MEASUREMENTS]
+                for stat, value in zip(stats, values):
+                    if value is None:
+                        continue
+                    stat[0] += 1
+                    stat[1] += value
+                    if value < stat[2]:
+                        stat[2] = value
+                    if value > stat[3]:
+                        stat[3] = value
+
+    def _prune_locked(self, horizon: Dict[str, int]) -> None:
+        """Descarta los buckets anteriores al horizonte de los tamaños cuyo horizonte avanzó."""
+        moved = {bucket for bucket, start in horizon.items() if self._horizon.get(bucket) != start}
+        for (bucket, _, _), series in self._series.items():
+            if bucket not in moved:
+                continue
+            cutoff = horizon[bucket]
+            for start in [start for start in series if start < cutoff]:
+                del series[start]
+        self._horizon = horizon
+
+    def query(
+        self,
+        bucket: str,
+        since: float | None,
+        until: float | None,
+        plant_config_id: str | None = None,
+        plant_type: str | None = None,
+        device_id: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket inválido, usa uno de: {', '.join(BUCKETS)}")
+        size = BUCKETS[bucket]
+        until = until if until is not None else datetime.now(tz=timezone.utc).timestamp()
+        since = since if since is not None else until - DEFAULT_WINDOW[bucket]
+        first = int(since // size * size)
+        last = int(until // size * size)
+        if (last - first) // size + 1 > MAX_POINTS:
+            raise ValueError(f"Rango demasiado grande para bucket {bucket} (máximo {MAX_POINTS} puntos)")
+
+        if device_id:
+            key: SeriesKey = (bucket, "device", device_id)
+        elif plant_config_id:
+            key = (bucket, "config", plant_config_id)
+        elif plant_type:
+            key = (bucket, "type", plant_type)
+        else:
+            key = (bucket, "all", "")
+
+        points = []
+        with self._lock:
+            series = self._series.get(key, {})
+            for start in range(first, last + 1, size):
+                stats = series.get(start)
+                if stats is None:
+                    continue
+                point: Dict[str, Any] = {"start": _iso(start), "count": max(stat[0] for stat in stats)}
+                for measurement, (count, total, low, high) in zip(MEASUREMENTS, stats):
+                    point[measurement] = (
+                        {"count": int(count), "min": low, "max": high, "mean": round(total / count, 3)}
+                        if count
+                        else None
+                    )
+                points.append(point)
+        return points
@@ -1,23 +1,73 @@
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timezone
+import gzip
+import os
+import shutil
+import logging
+import threading
+import time
 import uuid
 from pathlib import Path
-from typing import Dict, Iterable
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
 
 from rdflib import Graph, Literal, Namespace, URIRef
 from rdflib.namespace import RDF, RDFS, XSD
+from rdflib.plugins.serializers.nt import _nt_row
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from services.file_lock import file_lock
+from services.metrics import REGISTRY
+from services.observation_cache import timestamp_key
+from services.sqlite_triple_store import SQLiteTripleStore
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 RDF_FILE = DATA_DIR / "observations.ttl"
 
+# "memory": grafo rdflib en memoria persistido en Turtle (+ journal).
+# "sqlite": triples en data/observations.sqlite, sin cargar el grafo al arrancar.
+BACKEND = os.getenv("RDF_BACKEND", "memory").lower()
+BACKENDS = ("memory", "sqlite")
+
+# "journal": cada observación añade sus triples a un journal N-Triples y se
+# compacta a Turtle cada RDF_COMPACT_EVERY triples. "snapshot": reescribe el TTL.
+PERSIST_MODE = os.getenv("RDF_PERSIST_MODE", "journal").lower()
+COMPACT_EVERY = int(os.getenv("RDF_COMPACT_EVERY", "50000"))
+
+# "background": el grafo se carga en un hilo al crear el store (arranque inmediato).
+# "lazy": se carga en el primer uso. "eager": se carga en el constructor.
+LOAD_MODE = os.getenv("RDF_LOAD_MODE", "background").lower()
+LOAD_MODES = ("background", "lazy", "eager")
+
+SPARQL_TIMEOUT = float(os.getenv("SPARQL_TIMEOUT_SECONDS", "10"))
+SPARQL_CACHE_SIZE = int(os.getenv("SPARQL_CACHE_SIZE", "128"))
+SPARQL_WORKERS = int(os.getenv("SPARQL_WORKERS", "2"))
+
+FORMAT_MAP = {
+    "text/turtle": ("turtle", "ttl"),
+    "application/ld+json": ("json-ld", "jsonld"),
+    "application/rdf+xml": ("xml", "rdf"),
+}
+
 SOSA = Namespace("http://www.w3.org/ns/sosa/")
 SSN = Namespace("http://www.w3.org/ns/ssn/")
 EX = Namespace("http://example.org/smartplant/")
 QUDT = Namespace("http://qudt.org/schema/qudt/")
 UNIT = Namespace("http://qudt.org/vocab/unit/")
 
+logger = logging.getLogger("smartplant.semantic")
+
+PERSIST_SECONDS = REGISTRY.histogram(
+    "smartplant_rdf_persist_seconds",
+    "Persistencia de cada lote de triples (journal, snapshot o commit)",
+    ("mode",),
+)
+COMPACTIONS_TOTAL = REGISTRY.counter("smartplant_rdf_compactions_total", "Compactaciones del journal a Turtle")
+
 
 @dataclass(frozen=True)
 class Measurement:
@@ -49,13 +99,313 @@ MEASUREMENTS: Iterable[Measurement] = (
 )
 
 
+Triple = Tuple[URIRef, URIRef, URIRef | Literal]
+
+# Términos fijos de cada observación, resueltos una vez: `SOSA.x` crea un URIRef en cada acceso.
+_TYPE = RDF.type
+_OBSERVATION = SOSA.Observation
+_RESULT = SOSA.Result
+_HAS_FEATURE = SOSA.hasFeatureOfInterest
+_OBSERVED_PROPERTY = SOSA.observedProperty
+_MADE_BY_SENSOR = SOSA.madeBySensor
+_RESULT_TIME = SOSA.resultTime
+_PHENOMENON_TIME = SOSA.phenomenonTime
+_HAS_RESULT = SOSA.hasResult
+_HAS_SIMPLE_RESULT = SOSA.hasSimpleResult
+_UNIT = QUDT.unit
+_OBSERVATION_PREFIX = f"{EX}observation/"
+_RESULT_PREFIX = f"{EX}result/"
+
+# Literales xsd:float compartidos por valor: los sensores repiten valores (el DHT11
+# da enteros) y construir un Literal es lo más caro de cada triple.
+_FLOAT_LITERAL_CACHE_SIZE = 4096
+_float_literals: Dict[Tuple[type, str], Literal] = {}
+
+
+def _float_literal(value: float) -> Literal:
+    # La clave es el tipo más repr: Literal(22) y Literal(22.0) tienen distinta forma
+    # léxica, y -0.0 == 0.0 como número pero no como literal.
+    key = (type(value), repr(value))
+    literal = _float_literals.get(key)
+    if literal is None:
+        if len(_float_literals) >= _FLOAT_LITERAL_CACHE_SIZE:
+            _float_literals.clear()
+        literal = _float_literals[key] = Literal(value, datatype=XSD.float)
+    return literal
+
+
+# Parejas (plantName, location) con sus triples fijos cacheados por SemanticStore:
+# los nombres vienen del cliente, así que el caché se acota igual que el de literales.
+_STATIC_CACHE_SIZE = 4096
+
+
+class QueryTimeout(Exception):
+    """La consulta SPARQL superó SPARQL_TIMEOUT_SECONDS."""
+
+
+class QueryBusy(Exception):
+    """Ya hay SPARQL_WORKERS consultas en curso."""
+
+
+class InvalidQuery(ValueError):
+    """Consulta SPARQL mal formada o no permitida (UPDATE, SERVICE)."""
+
+
+def _algebra_names(node: Any) -> Iterator[str]:
+    """Nombres de todos los nodos del álgebra de una consulta preparada."""
+    if isinstance(node, CompValue):
+        yield node.name
+        for value in node.values():
+            yield from _algebra_names(value)
+    elif isinstance(node, (list, tuple)):
+        for value in node:
+            yield from _algebra_names(value)
+
+
+def _prepare_query(sparql: str) -> Any:
+    """prepareQuery más las restricciones del endpoint público.
+
+    SERVICE haría que rdflib abriera una conexión a la URL que elija el cliente
+    (SSRF) y esa espera no la corta el plazo de la consulta, así que se rechaza.
+    """
+    try:
+        prepared = prepareQuery(sparql)
+    except Exception as exc:
+        # prepareQuery rechaza sintaxis inválida y cualquier operación UPDATE.
+        raise InvalidQuery(f"Consulta SPARQL inválida: {exc}") from exc
+    if "ServiceGraphPattern" in _algebra_names(prepared.algebra):
+        raise InvalidQuery("SERVICE no está permitido")
+    return prepared
+
+
+class _ReadWriteLock:
+    """Cerrojo con lectores compartidos (consultas SPARQL) y un escritor exclusivo.
+
+    `with lock:` toma la escritura, igual que un threading.Lock. Un escritor en
+    espera bloquea a los lectores nuevos para que las consultas no dejen sin
+    turno a la ingesta; cada lector está acotado por el plazo de su consulta.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def __enter__(self) -> None:
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                self._cond.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def __exit__(self, *exc: Any) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    def acquire_read(self, timeout: float | None = None) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._writer and not self._waiting_writers, timeout):
+                return False
+            self._readers += 1
+            return True
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+
+class _DeadlineGraph(Graph):
+    """Vista del grafo para una consulta SPARQL: aborta al recorrer triples pasado el plazo.
+
+    La evaluación de rdflib pide los triples de cada patrón a `triples`, así que
+    una consulta desbocada se corta aquí en lugar de seguir ocupando el hilo.
+    """
+
+    def __init__(self, graph: Graph, deadline: float, timeout: float) -> None:
+        super().__init__(store=graph.store, identifier=graph.identifier, namespace_manager=graph.namespace_manager)
+        self._deadline = deadline
+        self._timeout = timeout
+
+    def triples(self, triple: Any) -> Iterable[Triple]:  # type: ignore[override]
+        deadline = self._deadline
+        for count, item in enumerate(super().triples(triple)):
+            if not count & 0xFF and time.monotonic() > deadline:
+                raise QueryTimeout(f"La consulta superó {self._timeout} s")
+            yield item
+
+
 class SemanticStore:
-    def __init__(self, path: Path | None = None) -> None:
+    def __init__(
+        self,
+        path: Path | None = None,
+        mode: str | None = None,
+        compact_every: int | None = None,
+        backend: str | None = None,
+        load: str | None = None,
+    ) -> None:
         self.path = path or RDF_FILE
-        self.graph = Graph()
+        self.journal_path = self.path.with_suffix(".journal.nt")
+        self.db_path = self.path.with_suffix(".sqlite")
+        # flock compartido por los workers que escriben el mismo grafo.
+        self.lock_path = self.path.with_suffix(".lock")
+        self.backend = (backend or BACKEND).lower()
+        if self.backend not in BACKENDS:
+            raise ValueError(f"RDF_BACKEND desconocido: {self.backend}")
+        self.mode = (mode or PERSIST_MODE).lower()
+        self.compact_every = COMPACT_EVERY if compact_every is None else compact_every
+        self.load_mode = (load or LOAD_MODE).lower()
+        if self.load_mode not in LOAD_MODES:
+            raise ValueError(f"RDF_LOAD_MODE desconocido: {self.load_mode}")
+        self.graph = Graph(store=SQLiteTripleStore()) if self.backend == "sqlite" else Graph()
+        # Escritura exclusiva para ingesta, sincronización y compactación; las
+        # consultas SPARQL lo toman en lectura durante toda la evaluación.
+        self._lock = _ReadWriteLock()
+        self._journal_triples = 0
+        # Estado en disco ya incorporado al grafo de este proceso (ver _sync_locked).
+        self._journal_offset = 0
+        self._snapshot_mtime_ns: int | None = None
+        self._data_version: int | None = None
+        # Se incrementa con cada cambio del grafo; invalida las exportaciones cacheadas.
+        self.version = 0
+        self.export_root = self.path.parent / "rdf_export"
+        self._export_lock = threading.Lock()
+        # Exportaciones reservadas por acquire_export (ruta -> reservas); no se podan.
+        self._exports_in_use: Dict[Path, int] = {}
+        # Índice de observaciones por sosa:resultTime (ordenado) y por feature of interest;
+        # se construye en la primera consulta filtrada.
+        self._indexed = False
+        self._time_keys: List[float] = []
+        self._time_uris: List[URIRef] = []
+        self._obs_feature: Dict[URIRef, URIRef] = {}
+        # Triples fijos (planta y ubicación) por (plantName, location), y las claves cuyos
+        # triples ya están en el grafo: no se vuelven a comprobar en cada observación.
+        # Se vacían juntos al llegar a _STATIC_CACHE_SIZE parejas.
+        self._static_triples: Dict[Tuple[str, str], Tuple[URIRef, List[Triple]]] = {}
+        self._static_present: set[Tuple[str, str]] = set()
+        self._query_cache: OrderedDict[Tuple[int, str], Tuple[str, str]] = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_slots = threading.BoundedSemaphore(max(SPARQL_WORKERS, 1))
+        # Estado de la carga inicial del grafo (ver RDF_LOAD_MODE).
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._load_thread: threading.Thread | None = None
+        self.load_error: BaseException | None = None
+        self.load_seconds: float | None = None
+        if self.load_mode == "eager":
+            self._load()
+        elif self.load_mode == "background":
+            self.start_loading()
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded.is_set() and self.load_error is None
+
+    def start_loading(self) -> None:
+        """Carga el grafo en un hilo en segundo plano (idempotente)."""
+        with self._load_lock:
+            if self._loaded.is_set() or self._load_thread is not None:
+                return
+            self._load_thread = threading.Thread(target=self._load, name="rdf-load", daemon=True)
+            self._load_thread.start()
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        try:
+            if self.backend == "sqlite":
+                self.graph.open(str(self.db_path), create=True)
+                self._bind_namespaces()
+                self.graph.commit()
+                self._data_version = self.graph.store.data_version()
+            else:
+                with file_lock(self.lock_path):
+                    self._load_files_locked()
+            self._clean_exports()
+        except BaseException as exc:
+            self.load_error = exc
+            logger.exception("No se pudo cargar el grafo RDF")
+        finally:
+            self.load_seconds = time.perf_counter() - started
+            self._loaded.set()
+        if self.load_error is None:
+            logger.info("Grafo RDF cargado en %.3f s", self.load_seconds)
+
+    def _load_files_locked(self) -> None:
+        """Carga snapshot + journal; se llama con el flock tomado."""
         self._bind_namespaces()
-        if self.path.exists():
+        try:
+            self._snapshot_mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._snapshot_mtime_ns = None
+        if self._snapshot_mtime_ns is not None:
             self.graph.parse(self.path, format="turtle")
+        self._replay_journal()
+
+    def _sync_locked(self, file_locked: bool = False) -> None:
+        """Incorpora lo que otros procesos escribieron desde la última vez.
+
+        Backend memory: si cambió el snapshot (otro worker compactó) se recarga el
+        grafo; si sólo creció el journal, se leen las líneas nuevas. Backend
+        sqlite: el grafo ya es compartido, sólo se invalida lo cacheado. Si nada
+        cambió cuesta un par de stat().
+        """
+        if self.backend == "sqlite":
+            data_version = self.graph.store.data_version()
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._reset_index()
+                self.version += 1
+            return
+        try:
+            mtime_ns: int | None = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        try:
+            journal_size = self.journal_path.stat().st_size
+        except FileNotFoundError:
+            journal_size = 0
+        if mtime_ns != self._snapshot_mtime_ns or journal_size < self._journal_offset:
+            self.graph = Graph()
+            if file_locked:
+                self._load_files_locked()
+            else:
+                with file_lock(self.lock_path):
+                    self._load_files_locked()
+            self._reset_index()
+            self.version += 1
+            return
+        if journal_size > self._journal_offset:
+            added = [triple for triple in self._read_journal() if triple not in self.graph]
+            if added:
+                self.graph.addN((*triple, self.graph) for triple in added)
+                self.version += 1
+                if self._indexed:
+                    self._index_triples(added)
+
+    def _reset_index(self) -> None:
+        self._indexed = False
+        self._time_keys = []
+        self._time_uris = []
+        self._obs_feature = {}
+        self._static_present = set()
+
+    def _ensure_loaded(self) -> None:
+        """Espera a la carga en curso, o la hace ahora en modo lazy."""
+        if not self._loaded.is_set():
+            with self._load_lock:
+                start_here = self._load_thread is None and not self._loaded.is_set()
+                if start_here:
+                    self._load_thread = threading.current_thread()
+            if start_here:
+                self._load()
+            self._loaded.wait()
+        if self.load_error is not None:
+            raise RuntimeError("El grafo RDF no está disponible") from self.load_error
 
     def _bind_namespaces(self) -> None:
         self.graph.bind("sosa", SOSA)
@@ -69,53 +419,432 @@ class SemanticStore:
         return text.lower().replace(" ", "-")
 
     def add_observation(self, payload: Dict[str, float], meta: Dict[str, str]) -> str:
-        now = datetime.fromisoformat(meta.get("timestamp") or datetime.now(tz=timezone.utc).isoformat())
-        iso_time = now.astimezone(timezone.utc).isoformat()
-        feature_uri = EX[f"feature/{self._slug(meta.get('plantName', 'SmartPlant'))}"]
-        location_uri = EX[f"location/{self._slug(meta.get('location', 'living-room'))}"]
+        return self.add_observations([(payload, meta)])[0]
 
-        self.graph.add((feature_uri, RDF.type, SOSA.FeatureOfInterest))
-        self.graph.add((feature_uri, RDFS.label, Literal(meta.get("plantName", "SmartPlant"))))
-        self.graph.add((feature_uri, SSN.hasProperty, EX["property/plant-health"]))
+    def add_observations(self, items: Sequence[Tuple[Dict[str, float], Dict[str, str]]]) -> List[str]:
+        """Añade varias observaciones y persiste una sola vez."""
+        self._ensure_loaded()
+        batch_ids: List[str] = []
+        triples: List[Triple] = []
+        static: Dict[Tuple[str, str], List[Triple]] = {}
+        for payload, meta in items:
+            batch_id, static_key, static_triples, observation_triples = self._build_triples(payload, meta)
+            batch_ids.append(batch_id)
+            static[static_key] = static_triples
+            triples.extend(observation_triples)
 
-        self.graph.add((location_uri, RDF.type, SSN.Platform))
-        self.graph.add((location_uri, RDFS.label, Literal(meta.get("location", "Living Room"))))
+        with self._lock, file_lock(self.lock_path):
+            self._sync_locked(file_locked=True)
+            # Los triples de cada observación cuelgan de URIs nuevas (batch_id): sólo los
+            # fijos pueden estar ya en el grafo, y sólo se miran la primera vez.
+            added = list(
+                dict.fromkeys(
+                    triple
+                    for key, static_triples in static.items()
+                    if key not in self._static_present
+                    for triple in static_triples
+                    if triple not in self.graph
+                )
+            )
+            added.extend(triples)
+            try:
+                self.graph.addN((*triple, self.graph) for triple in added)
+                with PERSIST_SECONDS.time(mode="sqlite" if self.backend == "sqlite" else self.mode):
+                    self._persist(added)
+            except Exception:
+                if self.backend == "sqlite":
+                    self.graph.rollback()
+                raise
+            self._static_present.update(static)
+            if added:
+                self.version += 1
+                if self._indexed:
+                    self._index_triples(added)
+        return batch_ids
 
-        batch_id = uuid.uuid4().hex[:8]
+    def _index_triples(self, triples: Iterable[Triple]) -> None:
+        for subject, predicate, obj in triples:
+            if predicate == SOSA.resultTime:
+                try:
+                    key = timestamp_key(str(obj))
+                except ValueError:
+                    continue
+                position = bisect_right(self._time_keys, key)
+                self._time_keys.insert(position, key)
+                self._time_uris.insert(position, subject)
+            elif predicate == SOSA.hasFeatureOfInterest:
+                self._obs_feature[subject] = obj
+
+    def subgraph(
+        self,
+        since: str | None = None,
+        until: str | None = None,
+        plant_name: str | None = None,
+        limit: int | None = None,
+    ) -> Graph:
+        """Subgrafo con las observaciones (más recientes primero) que cumplen los filtros.
+
+        Incluye cada observación, su resultado y el feature of interest asociado.
+        """
+        self._ensure_loaded()
+        since_key = timestamp_key(since) if since else None
+        until_key = timestamp_key(until) if until else None
+        feature = EX[f"feature/{self._slug(plant_name)}"] if plant_name else None
+        sub = Graph()
+        for prefix, namespace in self.graph.namespaces():
+            sub.bind(prefix, namespace)
+
+        with self._lock:
+            self._sync_locked()
+            if not self._indexed:
+                self._index_triples(self.graph.triples((None, SOSA.resultTime, None)))
+                self._index_triples(self.graph.triples((None, SOSA.hasFeatureOfInterest, None)))
+                self._indexed = True
+            start = bisect_left(self._time_keys, since_key) if since_key is not None else 0
+            end = bisect_right(self._time_keys, until_key) if until_key is not None else len(self._time_keys)
+            features = set()
+            selected = 0
+            for idx in range(end - 1, start - 1, -1):
+                obs_uri = self._time_uris[idx]
+                obs_feature = self._obs_feature.get(obs_uri)
+                if feature is not None and obs_feature != feature:
+                    continue
+                for triple in self.graph.triples((obs_uri, None, None)):
+                    sub.add(triple)
+                    if triple[1] == SOSA.hasResult:
+                        for result_triple in self.graph.triples((triple[2], None, None)):
+                            sub.add(result_triple)
+                if obs_feature is not None:
+                    features.add(obs_feature)
+                selected += 1
+                if limit and selected >= limit:
+                    break
+            for feature_uri in features:
+                for triple in self.graph.triples((feature_uri, None, None)):
+                    sub.add(triple)
+        return sub
+
+    def query(self, sparql: str, timeout: float | None = None) -> Tuple[str, str]:
+        """Ejecuta una consulta SPARQL de sólo lectura y devuelve (cuerpo, mimetype).
+
+        Los resultados se cachean por (versión del grafo, consulta). Las
+        operaciones UPDATE no se aceptan: prepareQuery sólo analiza consultas.
+        La consulta se evalúa en el hilo que llama, con el grafo en lectura (la
+        ingesta espera) y se aborta con QueryTimeout al pasar el plazo. Si ya
+        hay SPARQL_WORKERS consultas en curso se rechaza con QueryBusy; una
+        consulta mal formada o con SERVICE, con InvalidQuery.
+        """
+        self._ensure_loaded()
+        timeout = timeout or SPARQL_TIMEOUT
+        deadline = time.monotonic() + timeout
+        sparql = sparql.strip()
+        # El hueco se toma antes de sincronizar: la sincronización espera a las consultas en curso.
+        if not self._query_slots.acquire(blocking=False):
+            raise QueryBusy(f"Ya hay {SPARQL_WORKERS} consultas SPARQL en curso")
+        try:
+            with self._lock:
+                self._sync_locked()
+                version = self.version
+            with self._query_cache_lock:
+                cached = self._query_cache.get((version, sparql))
+                if cached is not None:
+                    self._query_cache.move_to_end((version, sparql))
+                    return cached
+            prepared = _prepare_query(sparql)
+            if not self._lock.acquire_read(max(deadline - time.monotonic(), 0)):
+                raise QueryTimeout(f"La consulta superó {timeout} s")
+            try:
+                # La versión que ve la consulta: el grafo no cambia hasta soltar la lectura.
+                version = self.version
+                body, mime = self._run_query(prepared, deadline, timeout)
+            finally:
+                self._lock.release_read()
+        finally:
+            self._query_slots.release()
+
+        with self._query_cache_lock:
+            self._query_cache[(version, sparql)] = (body, mime)
+            while len(self._query_cache) > SPARQL_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return body, mime
+
+    def _run_query(self, prepared: Any, deadline: float, timeout: float) -> Tuple[str, str]:
+        result = _DeadlineGraph(self.graph, deadline, timeout).query(prepared)
+        # Los resultados se generan al serializar, también dentro del plazo.
+        if result.type in ("CONSTRUCT", "DESCRIBE"):
+            return result.serialize(format="turtle").decode("utf-8"), "text/turtle"
+        return result.serialize(format="json").decode("utf-8"), "application/sparql-results+json"
+
+    def _static_for(self, plant_name: str, location: str) -> Tuple[Tuple[str, str], URIRef, List[Triple]]:
+        """URI de la planta y triples fijos de planta y ubicación, construidos una vez por pareja."""
+        key = (plant_name, location)
+        cached = self._static_triples.get(key)
+        if cached is None:
+            if len(self._static_triples) >= _STATIC_CACHE_SIZE:
+                # Al vaciarlo, los triples fijos se vuelven a comprobar contra el grafo.
+                self._static_triples = {}
+                self._static_present = set()
+            feature_uri = EX[f"feature/{self._slug(plant_name)}"]
+            location_uri = EX[f"location/{self._slug(location)}"]
+            cached = self._static_triples[key] = (
+                feature_uri,
+                [
+                    (feature_uri, RDF.type, SOSA.FeatureOfInterest),
+                    (feature_uri, RDFS.label, Literal(plant_name)),
+                    (feature_uri, SSN.hasProperty, EX["property/plant-health"]),
+                    (location_uri, RDF.type, SSN.Platform),
+                    (location_uri, RDFS.label, Literal(location)),
+                ],
+            )
+        return key, cached[0], cached[1]
+
+    def _build_triples(
+        self, payload: Dict[str, float], meta: Dict[str, str]
+    ) -> Tuple[str, Tuple[str, str], List[Triple], List[Triple]]:
+        """(batch_id, clave fija, triples fijos de planta/ubicación, triples de la lectura)."""
+        now = datetime.fromisoformat(meta.get("timestamp") or datetime.now(tz=timezone.utc).isoformat())
+        # Literal de un datetime: misma forma léxica que isoformat() sin volver a parsearla.
+        time_literal = Literal(now.astimezone(timezone.utc))
+        static_key, feature_uri, static_triples = self._static_for(
+            meta.get("plantName", "SmartPlant"), meta.get("location", "Living Room")
+        )
 
+        batch_id = uuid.uuid4().hex[:8]
+        triples: List[Triple] = []
         for measurement in MEASUREMENTS:
             value = payload.get(measurement.key)
             if value is None:
                 continue
 
-            obs_uri = EX[f"observation/{measurement.key}-{batch_id}"]
-            result_uri = EX[f"result/{measurement.key}-{batch_id}"]
+            obs_uri = URIRef(f"{_OBSERVATION_PREFIX}{measurement.key}-{batch_id}")
+            result_uri = URIRef(f"{_RESULT_PREFIX}{measurement.key}-{batch_id}")
+
+            triples.extend(
+                (
+                    (obs_uri, _TYPE, _OBSERVATION),
+                    (obs_uri, _HAS_FEATURE, feature_uri),
+                    (obs_uri, _OBSERVED_PROPERTY, measurement.observed_property),
+                    (obs_uri, _MADE_BY_SENSOR, measurement.sensor),
+                    (obs_uri, _RESULT_TIME, time_literal),
+                    (obs_uri, _PHENOMENON_TIME, time_literal),
+                    (obs_uri, _HAS_RESULT, result_uri),
+                    (result_uri, _TYPE, _RESULT),
+                    (result_uri, _HAS_SIMPLE_RESULT, _float_literal(value)),
+                    (result_uri, _UNIT, measurement.unit),
+                )
+            )
+
+        return batch_id, static_key, static_triples, triples
+
+    def _persist(self, added: List[Triple]) -> None:
+        if self.backend == "sqlite":
+            self.graph.commit()
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.mode != "journal":
+            self._write_snapshot()
+            return
+        if added:
+            with self.journal_path.open("a", encoding="utf-8") as fh:
+                fh.write("".join(_nt_row(triple) for triple in added))
+            self._journal_triples += len(added)
+            # Con el flock tomado, el final del journal es exactamente lo que ya está en el grafo.
+            self._journal_offset = self.journal_path.stat().st_size
+        if self.compact_every and self._journal_triples >= self.compact_every:
+            self._compact_locked()
 
-            self.graph.add((obs_uri, RDF.type, SOSA.Observation))
-            self.graph.add((obs_uri, SOSA.hasFeatureOfInterest, feature_uri))
-            self.graph.add((obs_uri, SOSA.observedProperty, measurement.observed_property))
-            self.graph.add((obs_uri, SOSA.madeBySensor, measurement.sensor))
-            self.graph.add((obs_uri, SOSA.resultTime, Literal(iso_time, datatype=XSD.dateTime)))
-            self.graph.add((obs_uri, SOSA.phenomenonTime, Literal(iso_time, datatype=XSD.dateTime)))
-            self.graph.add((obs_uri, SOSA.hasResult, result_uri))
+    def _write_snapshot(self) -> None:
+        tmp_path = self.path.with_suffix(".ttl.tmp")
+        self.graph.serialize(destination=tmp_path, format="turtle")
+        os.replace(tmp_path, self.path)
+        self._snapshot_mtime_ns = self.path.stat().st_mtime_ns
 
-            self.graph.add((result_uri, RDF.type, SOSA.Result))
-            self.graph.add((result_uri, SOSA.hasSimpleResult, Literal(value, datatype=XSD.float)))
-            self.graph.add((result_uri, QUDT.unit, measurement.unit))
+    def _replay_journal(self) -> None:
+        self._journal_offset = 0
+        self._journal_triples = 0
+        triples = self._read_journal()
+        self.graph.addN((*triple, self.graph) for triple in triples)
 
-        self._persist()
-        return batch_id
+    def _read_journal(self) -> List[Triple]:
+        """Triples del journal a partir de _journal_offset (sólo líneas completas)."""
+        try:
+            with self.journal_path.open("rb") as fh:
+                fh.seek(self._journal_offset)
+                data = fh.read()
+        except FileNotFoundError:
+            return []
+        # Una escritura interrumpida (o en curso en otro proceso) puede dejar la última línea incompleta.
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return []
+        text = data[:end].decode("utf-8", errors="replace")
+        journal = Graph()
+        try:
+            journal.parse(data=text, format="nt")
+        except Exception:
+            journal = Graph()
+            for line in text.splitlines():
+                try:
+                    journal.parse(data=line, format="nt")
+                except Exception:
+                    continue
+        self._journal_offset += end
+        self._journal_triples += len(journal)
+        return list(journal)
 
-    def _persist(self) -> None:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-        self.graph.serialize(destination=self.path, format="turtle")
+    def _compact_locked(self) -> None:
+        COMPACTIONS_TOTAL.inc()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_snapshot()
+        self.journal_path.unlink(missing_ok=True)
+        self._journal_triples = 0
+        self._journal_offset = 0
+
+    def compact(self) -> None:
+        """Vuelca el grafo completo a Turtle y vacía el journal (sólo backend memory)."""
+        if self.backend != "memory":
+            return
+        self._ensure_loaded()
+        with self._lock, file_lock(self.lock_path):
+            self._sync_locked(file_locked=True)
+            self._compact_locked()
+
+    def close(self) -> None:
+        if self._load_thread is not None:
+            self._loaded.wait()
+        if self.backend == "sqlite" and self.ready:
+            self.graph.close(commit_pending_transaction=True)
 
     def serialize(self, mime: str = "text/turtle") -> str:
-        format_map = {
-            "text/turtle": "turtle",
-            "application/ld+json": "json-ld",
-            "application/rdf+xml": "xml",
+        fmt = FORMAT_MAP.get(mime, FORMAT_MAP["text/turtle"])[0]
+        self._ensure_loaded()
+        _, snapshot = self._snapshot()
+        return snapshot.serialize(format=fmt)
+
+    def _snapshot(self, known_version: int | None = None) -> Tuple[int, Graph | None]:
+        """(versión, copia del grafo) tomada en lectura; None si la versión es `known_version`.
+
+        Copiar los triples cuesta una fracción de serializarlos, y la
+        serialización de la copia ya no frena la ingesta.
+        """
+        with self._lock:
+            self._sync_locked()
+        self._lock.acquire_read()
+        try:
+            version = self.version
+            if version == known_version:
+                return version, None
+            triples = [triple for triple, _ in self.graph.store.triples((None, None, None), None)]
+            namespaces = list(self.graph.namespaces())
+        finally:
+            self._lock.release_read()
+        snapshot = Graph()
+        for prefix, namespace in namespaces:
+            snapshot.bind(prefix, namespace, override=True)
+        snapshot.addN((*triple, snapshot) for triple in triples)
+        return version, snapshot
+
+    def acquire_export(self, mime: str = "text/turtle", compressed: bool = False) -> Tuple[Path, int]:
+        """Ruta de una exportación del grafo en disco para la versión actual.
+
+        La serialización se hace una sola vez por (versión, formato) y se escribe
+        directamente a fichero, así la respuesta HTTP puede enviarse por bloques
+        sin construir el grafo entero como string. Devuelve (ruta, versión). La
+        ruta queda reservada hasta `release_export`: la poda de versiones viejas
+        no la borra antes de que quien la pidió la abra.
+        """
+        fmt, ext = FORMAT_MAP.get(mime, FORMAT_MAP["text/turtle"])
+        self._ensure_loaded()
+        export_dir = self.export_dir
+        # _export_lock sólo evita serializar dos veces la misma versión: el grafo se
+        # serializa desde una copia, sin bloquear la ingesta.
+        with self._export_lock:
+            version = self.version
+            target = export_dir / f"graph-{version}.{ext}"
+            version, snapshot = self._snapshot(known_version=version if target.exists() else None)
+            target = export_dir / f"graph-{version}.{ext}"
+            if snapshot is not None and not target.exists():
+                export_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = target.with_suffix(target.suffix + ".tmp")
+                snapshot.serialize(destination=tmp_path, format=fmt)
+                os.replace(tmp_path, target)
+            if compressed:
+                gz_target = target.with_suffix(target.suffix + ".gz")
+                if not gz_target.exists():
+                    tmp_path = gz_target.with_suffix(".gz.tmp")
+                    with target.open("rb") as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.replace(tmp_path, gz_target)
+                target = gz_target
+            self._exports_in_use[target] = self._exports_in_use.get(target, 0) + 1
+            self._prune_exports(export_dir, version)
+            return target, version
+
+    def release_export(self, path: Path) -> None:
+        """Libera una ruta de `acquire_export` una vez abierta."""
+        with self._export_lock:
+            remaining = self._exports_in_use.get(path, 0) - 1
+            if remaining > 0:
+                self._exports_in_use[path] = remaining
+            else:
+                self._exports_in_use.pop(path, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño del grafo y de sus ficheros, para /api/metrics."""
+        files = {"snapshot": self.path, "journal": self.journal_path, "sqlite": self.db_path}
+        sizes = {name: path.stat().st_size for name, path in files.items() if path.exists()}
+        return {
+            "triples": len(self.graph) if self.ready else 0,
+            "version": self.version,
+            "fileBytes": sizes,
         }
-        fmt = format_map.get(mime, "turtle")
-        return self.graph.serialize(format=fmt)
 
+    @property
+    def export_dir(self) -> Path:
+        """Directorio de exportaciones de este proceso: cada worker numera sus versiones."""
+        return self.export_root / str(os.getpid())
+
+    def _clean_exports(self) -> None:
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+        if os.name != "posix" or not self.export_root.exists():
+            return
+        # Exportaciones de workers que ya no existen.
+        for path in self.export_root.iterdir():
+            if not path.is_dir():
+                # Exportaciones del formato anterior, sin subdirectorio por proceso.
+                path.unlink(missing_ok=True)
+                continue
+            if not path.name.isdigit():
+                continue
+            try:
+                os.kill(int(path.name), 0)
+            except ProcessLookupError:
+                shutil.rmtree(path, ignore_errors=True)
+            except PermissionError:
+                continue
+
+    def _prune_exports(self, export_dir: Path, version: int) -> None:
+        for path in export_dir.glob("graph-*"):
+            if not path.name.startswith(f"graph-{version}.") and path not in self._exports_in_use:
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError:
+                    # En Windows no se puede borrar un fichero que aún se está enviando.
+                    continue
+
+
+def migrate_turtle_to_sqlite(source: Path | None = None, target: Path | None = None) -> int:
+    """Copia observations.ttl (+ journal) a una base SQLite. Devuelve los triples copiados."""
+    memory = SemanticStore(path=source or RDF_FILE, backend="memory", compact_every=0, load="eager")
+    target = target or memory.db_path
+    graph = Graph(store=SQLiteTripleStore())
+    graph.open(str(target), create=True)
+    try:
+        for prefix, namespace in memory.graph.namespaces():
+            graph.bind(prefix, namespace)
+        graph.addN((*triple, graph) for triple in memory.graph)
+        graph.commit()
+        return len(graph)
+    finally:
+        graph.close(commit_pending_transaction=True)
+        memory.close()
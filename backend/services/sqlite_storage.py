@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from services.observation_cache import timestamp_key
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DB_FILE = Path(os.getenv("STORAGE_DB_PATH", str(DATA_DIR / "smartplant.sqlite")))
+RETENTION_DAYS = float(os.getenv("OBS_RETENTION_DAYS", "180"))
+# Cada cuántas escrituras se aplica la retención sobre las observaciones antiguas.
+_RETENTION_EVERY = 1000
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "plantName": "SmartPlant",
+    "location": "Living Room",
+    "samplingSeconds": 60,
+    "plantType": "monstera-deliciosa",
+    "plantConfigId": None,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    timestamp TEXT,
+    plantConfigId TEXT,
+    plantType TEXT,
+    deviceId TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_cfg_ts ON observations (plantConfigId, ts);
+CREATE INDEX IF NOT EXISTS observations_type_ts ON observations (plantType, ts);
+CREATE INDEX IF NOT EXISTS observations_ts ON observations (ts);
+CREATE TABLE IF NOT EXISTS config (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plant_configs (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS devices (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('observations_version', 0);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready: set[str] = set()
+_writes = 0
+
+
+def _connect() -> sqlite3.Connection:
+    """Conexión por hilo; SQLite en modo WAL permite lectores concurrentes con un escritor."""
+    path = str(DB_FILE)
+    conn: sqlite3.Connection | None = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == path:
+        return conn
+    DB_FILE.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if path not in _schema_ready:
+            conn.executescript(_SCHEMA)
+            _migrate_schema(conn)
+            _schema_ready.add(path)
+    _local.conn = conn
+    _local.path = path
+    return conn
+
+
+def _migrate_schema(conn: sqlite3.Connection) -> None:
+    """Añade las columnas que no existían en bases creadas por versiones anteriores."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(observations)")}
+    if "deviceId" not in columns:
+        conn.execute("ALTER TABLE observations ADD COLUMN deviceId TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS observations_device_ts ON observations (deviceId, ts)")
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK sobre la conexión del hilo."""
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn = _connect()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def _row_values(record: Dict[str, Any]) -> tuple:
+    try:
+        ts = timestamp_key(record.get("timestamp"))
+    except ValueError:
+        ts = time.time()
+    return (
+        ts,
+        record.get("timestamp"),
+        record.get("plantConfigId"),
+        record.get("plantType"),
+        record.get("deviceId"),
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+    )
+
+
+def _bump_version(conn: sqlite3.Connection) -> None:
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'observations_version'")
+
+
+def _apply_retention(conn: sqlite3.Connection) -> None:
+    if RETENTION_DAYS > 0:
+        conn.execute("DELETE FROM observations WHERE ts < ?", (time.time() - RETENTION_DAYS * 86400,))
+
+
+def append_observation(record: Dict[str, Any]) -> None:
+    append_observations([record])
+
+
+def append_observations(records: List[Dict[str, Any]]) -> None:
+    """Inserta el lote en una sola transacción."""
+    global _writes
+    if not records:
+        return
+    with _Transaction() as conn:
+        conn.executemany(
+            "INSERT INTO observations (ts, timestamp, plantConfigId, plantType, deviceId, data)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [_row_values(record) for record in records],
+        )
+        _bump_version(conn)
+        _writes += 1
+        if _writes % _RETENTION_EVERY == 0:
+            _apply_retention(conn)
+
+
+def observations_version() -> int:
+    return _connect().execute("SELECT value FROM meta WHERE key = 'observations_version'").fetchone()[0]
+
+
+def count_observations() -> int:
+    return _connect().execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+
+
+def clear_observations() -> None:
+    """Borra el histórico de observaciones."""
+    with _Transaction() as conn:
+        conn.execute("DELETE FROM observations")
+        _bump_version(conn)
+
+
+def log_size_bytes() -> int:
+    """Tamaño de la base (incluido el WAL)."""
+    wal = DB_FILE.with_name(DB_FILE.name + "-wal")
+    return sum(path.stat().st_size for path in (DB_FILE, wal) if path.exists())
+
+
+def read_changes(cursor: int | None) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Observaciones insertadas después del id `cursor` (None = todas): (observaciones, cursor, reset)."""
+    conn = _connect()
+    last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM observations").fetchone()[0]
+    # Un id menor que el cursor significa que la tabla se vació y se volvió a llenar.
+    reset = cursor is None or last < cursor
+    start = 0 if reset else cursor
+    rows = conn.execute(
+        "SELECT data FROM observations WHERE id > ? AND id <= ? ORDER BY id", (start, last)
+    ).fetchall()
+    return [json.loads(row[0]) for row in rows], last, reset
+
+
+def load_observations(
+    limit: int | None = None,
+    plant_config_id: str | None = None,
+    plant_type: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    device_id: str | None = None,
+) -> List[Dict[str, Any]]:
+    """Observaciones filtradas en orden cronológico, resueltas con los índices por (clave, ts)."""
+    clauses = []
+    params: List[Any] = []
+    if device_id:
+        clauses.append("deviceId = ?")
+        params.append(device_id)
+    if plant_config_id:
+        clauses.append("plantConfigId = ?")
+        params.append(plant_config_id)
+    if plant_type:
+        clauses.append("plantType = ?")
+        params.append(plant_type)
+    if since:
+        clauses.append("ts >= ?")
+        params.append(timestamp_key(since))
+    if until:
+        clauses.append("ts <= ?")
+        params.append(timestamp_key(until))
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    conn = _connect()
+    if limit:
+        rows = conn.execute(
+            f"SELECT data FROM observations{where} ORDER BY ts DESC, id DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        rows.reverse()
+    else:
+        rows = conn.execute(f"SELECT data FROM observations{where} ORDER BY ts, id", params).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def load_config() -> Dict[str, Any]:
+    row = _connect().execute("SELECT data FROM config WHERE id = 1").fetchone()
+    return json.loads(row[0]) if row else dict(DEFAULT_CONFIG)
+
+
+def save_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    with _Transaction() as conn:
+        row = conn.execute("SELECT data FROM config WHERE id = 1").fetchone()
+        merged = json.loads(row[0]) if row else dict(DEFAULT_CONFIG)
+        merged.update(config)
+        conn.execute("INSERT OR REPLACE INTO config (id, data) VALUES (1, ?)", (json.dumps(merged),))
+    return merged
+
+
+def load_plant_configs() -> List[Dict[str, Any]]:
+    rows = _connect().execute("SELECT data FROM plant_configs ORDER BY position").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def add_plant_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    with _Transaction() as conn:
+        position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM plant_configs").fetchone()[0]
+        conn.execute(
+            "INSERT OR IGNORE INTO plant_configs (id, position, data) VALUES (?, ?, ?)",
+            (cfg.get("id"), position, json.dumps(cfg)),
+        )
+    return cfg
+
+
+def get_plant_config(cfg_id: str) -> Dict[str, Any] | None:
+    row = _connect().execute("SELECT data FROM plant_configs WHERE id = ?", (cfg_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def load_devices() -> List[Dict[str, Any]]:
+    rows = _connect().execute("SELECT data FROM devices ORDER BY position").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def get_device(device_id: str) -> Dict[str, Any] | None:
+    row = _connect().execute("SELECT data FROM devices WHERE id = ?", (device_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def register_device(device: Dict[str, Any], max_devices: int | None = None) -> Dict[str, Any] | None:
+    """Añade el dispositivo si no existe; si ya estaba registrado devuelve la entrada existente.
+
+    Con `max_devices`, devuelve None en lugar de añadirlo si el registro ya está lleno.
+    """
+    with _Transaction() as conn:
+        row = conn.execute("SELECT data FROM devices WHERE id = ?", (device["id"],)).fetchone()
+        if row:
+            return json.loads(row[0])
+        if max_devices is not None and conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] >= max_devices:
+            return None
+        position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM devices").fetchone()[0]
+        conn.execute(
+            "INSERT INTO devices (id, position, data) VALUES (?, ?, ?)",
+            (device["id"], position, json.dumps(device)),
+        )
+    return dict(device)
+
+
+def update_device(device_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Actualiza (o crea) la entrada del dispositivo con `changes`."""
+    with _Transaction() as conn:
+        row = conn.execute("SELECT position, data FROM devices WHERE id = ?", (device_id,)).fetchone()
+        if row:
+            position, existing = row[0], json.loads(row[1])
+        else:
+            position = conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM devices").fetchone()[0]
+            existing = {}
+        merged = {**existing, **changes, "id": device_id}
+        conn.execute(
+            "INSERT OR REPLACE INTO devices (id, position, data) VALUES (?, ?, ?)",
+            (device_id, position, json.dumps(merged)),
+        )
+    return merged
+
+
+def invalidate_config_cache() -> None:
+    """Sin caché que invalidar: cada lectura consulta la base."""
+
+
+def import_records(records: Iterable[Dict[str, Any]], batch_size: int = 5000) -> int:
+    """Importa observaciones por lotes; devuelve cuántas se insertaron."""
+    total = 0
+    batch: List[Dict[str, Any]] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            append_observations(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        append_observations(batch)
+        total += len(batch)
+    return total
+
+
+def import_json_files(
+    observations: Path | None,
+    config: Path | None,
+    plant_configs: Path | None,
+    devices: Path | None = None,
+) -> Dict[str, int]:
+    """Importa observations.json (array JSON), config.json, plant_configs.json y devices.json a SQLite."""
+    imported = {"observations": 0, "plantConfigs": 0, "config": 0, "devices": 0}
+    if observations and observations.exists():
+        imported["observations"] = import_records(json.loads(observations.read_text(encoding="utf-8") or "[]"))
+    if config and config.exists():
+        save_config(json.loads(config.read_text(encoding="utf-8")))
+        imported["config"] = 1
+    if plant_configs and plant_configs.exists():
+        existing = {item.get("id") for item in load_plant_configs()}
+        for item in json.loads(plant_configs.read_text(encoding="utf-8") or "[]"):
+            if item.get("id") not in existing:
+                add_plant_config(item)
+                imported["plantConfigs"] += 1
+    if devices and devices.exists():
+        for item in json.loads(devices.read_text(encoding="utf-8") or "[]"):
+            if get_device(item.get("id")) is None:
+                register_device(item)
+                imported["devices"] += 1
+    return imported
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from rdflib import Literal, URIRef
+from rdflib.plugins.parsers.ntriples import unquote
+from rdflib.plugins.serializers.nt import _quoteLiteral
+from rdflib.store import NO_STORE, VALID_STORE, Store
+from rdflib.term import Node
+from rdflib.util import from_n3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS triples (
+    s TEXT NOT NULL,
+    p TEXT NOT NULL,
+    o TEXT NOT NULL,
+    PRIMARY KEY (s, p, o)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_po ON triples (p, o);
+CREATE INDEX IF NOT EXISTS triples_os ON triples (o, s);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL
+);
+"""
+
+
+@lru_cache(maxsize=65536)
+def _decode(value: str) -> Node:
+    if not value.startswith('"'):
+        return from_n3(value)
+    # Literal en N-Triples: se conserva la forma léxica tal cual (sin normalizar).
+    end = value.rfind('"')
+    lexical = unquote(value[1:end])
+    suffix = value[end + 1 :]
+    if suffix.startswith("^^<"):
+        return Literal(lexical, datatype=URIRef(suffix[3:-1]), normalize=False)
+    if suffix.startswith("@"):
+        return Literal(lexical, lang=suffix[1:], normalize=False)
+    return Literal(lexical, normalize=False)
+
+
+def _encode(term: Node) -> str:
+    if isinstance(term, Literal):
+        return _quoteLiteral(term)
+    return term.n3()
+
+
+class SQLiteTripleStore(Store):
+    """Store rdflib persistido en un fichero SQLite (sólo librería estándar).
+
+    Cada término se guarda en su forma N-Triples. Las escrituras quedan dentro
+    de una transacción hasta `commit()` (o se descartan con `rollback()`), y
+    las consultas por patrón se resuelven con los índices (s,p,o), (p,o) y
+    (o,s) sin cargar el grafo en memoria.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+    graph_aware = False
+
+    def __init__(self, configuration: Optional[str] = None, identifier: Any = None) -> None:
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.RLock()
+        self.identifier = identifier
+        super().__init__(configuration)
+
+    def open(self, configuration: str, create: bool = True) -> int:
+        path = Path(configuration)
+        if not create and not path.exists():
+            return NO_STORE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction: bool = False) -> None:
+        if self._conn is None:
+            return
+        with self._lock:
+            if commit_pending_transaction:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+            self._conn.close()
+            self._conn = None
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple[Any, ...]]:
+        if self._conn is None:
+            raise RuntimeError("SQLiteTripleStore no está abierto")
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def add(self, triple: Any, context: Any = None, quoted: bool = False) -> None:
+        self.addN([(*triple, context)])
+
+    def addN(self, quads: Iterable[Any]) -> None:  # noqa: N802
+        rows = [(_encode(s), _encode(p), _encode(o)) for s, p, o, _ in quads]
+        if self._conn is None:
+            raise RuntimeError("SQLiteTripleStore no está abierto")
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)", rows)
+
+    @staticmethod
+    def _where(triple_pattern: Any) -> Tuple[str, List[str]]:
+        clauses = []
+        params = []
+        for column, term in zip(("s", "p", "o"), triple_pattern):
+            if term is not None:
+                clauses.append(f"{column} = ?")
+                params.append(_encode(term))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def remove(self, triple_pattern: Any, context: Any = None) -> None:
+        where, params = self._where(triple_pattern)
+        self._execute(f"DELETE FROM triples{where}", params)
+
+    def triples(self, triple_pattern: Any, context: Any = None) -> Iterator[Tuple[Any, Iterator[Any]]]:
+        where, params = self._where(triple_pattern)
+        for s, p, o in self._execute(f"SELECT s, p, o FROM triples{where}", params):
+            yield (_decode(s), _decode(p), _decode(o)), iter(())
+
+    def __len__(self, context: Any = None) -> int:
+        return self._execute("SELECT COUNT(*) FROM triples")[0][0]
+
+    def contexts(self, triple: Any = None) -> Iterator[Any]:
+        return iter(())
+
+    def bind(self, prefix: str, namespace: URIRef, override: bool = True) -> None:
+        if not override and self.namespace(prefix) is not None:
+            return
+        self._execute("INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)", (prefix, str(namespace)))
+
+    def namespace(self, prefix: str) -> Optional[URIRef]:
+        rows = self._execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,))
+        return URIRef(rows[0][0]) if rows else None
+
+    def prefix(self, namespace: URIRef) -> Optional[str]:
+        rows = self._execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),))
+        return rows[0][0] if rows else None
+
+    def namespaces(self) -> Iterator[Tuple[str, URIRef]]:
+        for prefix, uri in self._execute("SELECT prefix, uri FROM namespaces"):
+            yield prefix, URIRef(uri)
+
+    def data_version(self) -> int:
+        """Cambia cuando otra conexión (p. ej. otro worker) confirma cambios en la base."""
+        return self._execute("PRAGMA data_version")[0][0]
+
+    def commit(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.commit()
+
+    def rollback(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.rollback()
@@ -1,95 +1,575 @@
 from __future__ import annotations
 
+import heapq
 import json
+import os
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from services.file_lock import file_lock
+from services.observation_cache import ObservationIndex, timestamp_key
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 OBS_FILE = DATA_DIR / "observations.json"
+OBS_LOG_DIR = DATA_DIR / "observations"
 CFG_FILE = DATA_DIR / "config.json"
 PLANT_CFGS_FILE = DATA_DIR / "plant_configs.json"
+DEVICES_FILE = DATA_DIR / "devices.json"
+
+# "files": log NDJSON segmentado + JSON; "sqlite": services/sqlite_storage.py.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files").lower()
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+SEGMENT_MAX_BYTES = int(os.getenv("OBS_SEGMENT_MAX_BYTES", str(4 * 1024 * 1024)))
+RETENTION_DAYS = float(os.getenv("OBS_RETENTION_DAYS", "180"))
+RETENTION_SEGMENTS = int(os.getenv("OBS_RETENTION_SEGMENTS", "0"))
+CACHE_SIZE = int(os.getenv("OBS_CACHE_SIZE", "5000"))
+# Cada cuántos segundos se comprueba el mtime de config.json / plant_configs.json / devices.json.
+CONFIG_CHECK_INTERVAL = float(os.getenv("CONFIG_CHECK_INTERVAL", "2"))
+
+# Posición (segmento, offset) en el log.
+Cursor = Tuple[int, int]
+
+# _log_lock protege el estado del proceso (índice, segmento activo); las
+# escrituras toman además un flock sobre OBS_LOG_DIR/.lock para que varios
+# workers puedan compartir el log.
+_log_lock = threading.Lock()
+_active_segment: Path | None = None
+_active_size = 0
+_index: ObservationIndex | None = None
+# Hasta dónde del log ha leído el índice de este proceso.
+_cursor: Cursor = (0, 0)
+_files_ready = False
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "plantName": "SmartPlant",
+    "location": "Living Room",
+    "samplingSeconds": 60,
+    "plantType": "monstera-deliciosa",
+    "plantConfigId": None,
+}
+
+
+class _CachedJsonFile:
+    """Contenido JSON de un fichero cacheado en memoria e invalidado por mtime.
+
+    Con `index_key` se mantiene además un índice {item[index_key]: item} para
+    ficheros que contienen una lista de objetos. Si el fichero desaparece se
+    sirve `default()` hasta que `_ensure_files` lo vuelve a crear.
+    """
+
+    def __init__(self, default: Callable[[], Any], index_key: str | None = None) -> None:
+        self.default = default
+        self.index_key = index_key
+        self.path: Path | None = None
+        self.value: Any = None
+        self.index: Dict[Any, Dict[str, Any]] = {}
+        self.mtime_ns: int | None = None
+        self.checked_at = 0.0
+
+    def read(self, path: Path) -> Any:
+        global _files_ready
+        now = time.monotonic()
+        if self.path == path and self.value is not None and now - self.checked_at < CONFIG_CHECK_INTERVAL:
+            return self.value
+        try:
+            mtime_ns: int | None = path.stat().st_mtime_ns
+            if self.path != path or self.value is None or mtime_ns != self.mtime_ns:
+                self._set(path, json.loads(path.read_text(encoding="utf-8")), mtime_ns)
+        except FileNotFoundError:
+            # Borrado en caliente: la próxima llamada a _ensure_files lo recrea (bajo el
+            # lock, que aquí puede estar ya tomado por quien va a escribirlo).
+            _files_ready = False
+            self._set(path, self.default(), None)
+        self.checked_at = now
+        return self.value
+
+    def refresh(self, path: Path) -> Any:
+        """Relee el fichero si cambió, sin esperar a CONFIG_CHECK_INTERVAL."""
+        self.checked_at = 0.0
+        return self.read(path)
+
+    def write(self, path: Path, value: Any) -> None:
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(value, indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._set(path, value, path.stat().st_mtime_ns)
+        self.checked_at = time.monotonic()
+
+    def _set(self, path: Path, value: Any, mtime_ns: int | None) -> None:
+        self.path = path
+        self.value = value
+        self.mtime_ns = mtime_ns
+        if self.index_key:
+            self.index = {item.get(self.index_key): item for item in reversed(value)}
+
+    def invalidate(self) -> None:
+        self.value = None
+        self.index = {}
+
+
+_config_cache = _CachedJsonFile(lambda: dict(DEFAULT_CONFIG))
+_plant_configs_cache = _CachedJsonFile(list, index_key="id")
+_devices_cache = _CachedJsonFile(list, index_key="id")
+
+
+def invalidate_config_cache() -> None:
+    """Fuerza a releer config.json, plant_configs.json y devices.json en el próximo acceso."""
+    global _files_ready
+    _files_ready = False
+    _config_cache.invalidate()
+    _plant_configs_cache.invalidate()
+    _devices_cache.invalidate()
+
+
+def _log_file_lock():
+    return file_lock(OBS_LOG_DIR / ".lock")
+
+
+def _config_file_lock():
+    return file_lock(DATA_DIR / ".config.lock")
 
 
 def _ensure_files() -> None:
+    global _files_ready
+    if _files_ready:
+        return
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    if not OBS_FILE.exists():
-        OBS_FILE.write_text("[]", encoding="utf-8")
-    if not CFG_FILE.exists():
-        CFG_FILE.write_text(
-            json.dumps(
-                {
-                    "plantName": "SmartPlant",
-                    "location": "Living Room",
-                    "samplingSeconds": 60,
-                    "plantType": "monstera-deliciosa",
-                    "plantConfigId": None,
-                },
-                indent=2,
-            ),
-            encoding="utf-8",
-        )
-    if not PLANT_CFGS_FILE.exists():
-        PLANT_CFGS_FILE.write_text("[]", encoding="utf-8")
-
-
-def append_observation(record: Dict[str, Any], max_records: int = 200) -> None:
+    OBS_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    if OBS_FILE.exists():
+        _migrate_legacy_observations()
+    with _config_file_lock():
+        if not CFG_FILE.exists():
+            _config_cache.write(CFG_FILE, dict(DEFAULT_CONFIG))
+        if not PLANT_CFGS_FILE.exists():
+            _plant_configs_cache.write(PLANT_CFGS_FILE, [])
+        if not DEVICES_FILE.exists():
+            _devices_cache.write(DEVICES_FILE, [])
+    _files_ready = True
+
+
+def _migrate_legacy_observations() -> None:
+    """Vuelca el antiguo observations.json al log segmentado (una sola vez)."""
+    with _log_lock, _log_file_lock():
+        if not OBS_FILE.exists():
+            return
+        if not _segments():
+            legacy: List[Dict[str, Any]] = json.loads(OBS_FILE.read_text(encoding="utf-8") or "[]")
+            if legacy:
+                _write_lines([_encode(item) for item in legacy])
+        OBS_FILE.rename(OBS_FILE.with_suffix(".json.migrated"))
+
+
+def _segments() -> List[Path]:
+    return sorted(OBS_LOG_DIR.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+
+def _segment_path(seq: int) -> Path:
+    return OBS_LOG_DIR / f"{SEGMENT_PREFIX}{seq:08d}{SEGMENT_SUFFIX}"
+
+
+def _segment_seq(path: Path) -> int:
+    return int(path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)])
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _open_active_segment() -> Path:
+    global _active_segment, _active_size
+    if _active_segment is None or not _active_segment.exists():
+        segments = _segments()
+        _active_segment = segments[-1] if segments else _segment_path(1)
+        _active_size = _active_segment.stat().st_size if _active_segment.exists() else 0
+    return _active_segment
+
+
+def _sync_active_segment() -> None:
+    """Reajusta el segmento activo con lo que hay en disco (otro proceso pudo rotar o escribir)."""
+    global _active_segment, _active_size
+    segment = _open_active_segment()
+    while True:
+        following = _segment_path(_segment_seq(segment) + 1)
+        if not following.exists():
+            break
+        segment = following
+    _active_segment = segment
+    _active_size = segment.stat().st_size if segment.exists() else 0
+
+
+def _rotate() -> Path:
+    global _active_segment, _active_size
+    current = _open_active_segment()
+    _active_segment = _segment_path(_segment_seq(current) + 1)
+    _active_size = 0
+    _apply_retention()
+    return _active_segment
+
+
+def _apply_retention() -> None:
+    """Elimina segmentos cerrados según OBS_RETENTION_DAYS / OBS_RETENTION_SEGMENTS."""
+    closed = [path for path in _segments() if path != _active_segment]
+    if RETENTION_SEGMENTS > 0 and len(closed) >= RETENTION_SEGMENTS:
+        for path in closed[: len(closed) - RETENTION_SEGMENTS + 1]:
+            path.unlink(missing_ok=True)
+        closed = closed[len(closed) - RETENTION_SEGMENTS + 1 :]
+    if RETENTION_DAYS > 0:
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        for path in closed:
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+
+
+def _write_lines(lines: List[bytes]) -> None:
+    """Escribe las líneas con una escritura por segmento tocado."""
+    global _active_size
+    segment = _open_active_segment()
+    pending: List[bytes] = []
+    for line in lines:
+        if _active_size and _active_size + len(line) > SEGMENT_MAX_BYTES:
+            if pending:
+                with segment.open("ab") as fh:
+                    fh.write(b"".join(pending))
+                pending = []
+            segment = _rotate()
+        pending.append(line)
+        _active_size += len(line)
+    if pending:
+        with segment.open("ab") as fh:
+            fh.write(b"".join(pending))
+
+
+def iter_log_observations() -> Iterator[Dict[str, Any]]:
+    """Todas las observaciones del log segmentado en orden de escritura, sin cargarlas en memoria.
+
+    Lee siempre los ficheros de `data/observations/`, también con
+    STORAGE_BACKEND=sqlite (no se sustituye por la versión SQLite): es el
+    origen de `manage.py import-observations`.
+    """
+    for segment in _segments():
+        with segment.open("rb") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def _read_from(cursor: Cursor) -> Iterator[Tuple[Cursor, List[Dict[str, Any]]]]:
+    """Lecturas añadidas al log (por cualquier proceso) a partir de `cursor`.
+
+    Produce (cursor nuevo, observaciones) por segmento. Sólo se consumen líneas
+    completas, así una escritura a medias de otro proceso se lee en la siguiente
+    llamada. Si el log no cambió, cuesta un par de stat().
+    """
+    seq, offset = cursor
+    while True:
+        path = _segment_path(seq)
+        try:
+            size: int | None = path.stat().st_size
+        except FileNotFoundError:
+            size = None
+        if size is not None and size > offset:
+            with path.open("rb") as fh:
+                fh.seek(offset)
+                data = fh.read(size - offset)
+            end = data.rfind(b"\n") + 1
+            if end:
+                records = []
+                for line in data[:end].splitlines():
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+                offset += end
+                yield (seq, offset), records
+        if _segment_path(seq + 1).exists():
+            seq, offset = seq + 1, 0
+            continue
+        if size is None:
+            # Segmento inicial o borrado por la retención: se salta al siguiente que exista.
+            later = [_segment_seq(path) for path in _segments() if _segment_seq(path) > seq]
+            if later:
+                seq, offset = later[0], 0
+                continue
+        return
+
+
+def _catch_up_locked() -> None:
+    """Añade al índice lo escrito desde la última lectura (también por otros workers)."""
+    global _cursor
+    if _index is None:
+        return
+    for cursor, records in _read_from(_cursor):
+        for record in records:
+            _index.add(record)
+        _cursor = cursor
+
+
+def _get_index() -> ObservationIndex:
+    """Índice en memoria; se construye con una pasada sobre el log la primera vez."""
+    global _index, _cursor
+    if _index is None:
+        _index = ObservationIndex(CACHE_SIZE)
+        _cursor = (0, 0)
+    _catch_up_locked()
+    return _index
+
+
+def append_observation(record: Dict[str, Any]) -> None:
+    append_observations([record])
+
+
+def observations_version() -> int:
+    """Posición del final del log vista por este proceso; cambia con cada escritura (para ETags).
+
+    Al derivarse del log, todos los workers dan el mismo valor para los mismos datos.
+    """
+    _ensure_files()
+    with _log_lock:
+        _get_index()
+        return _cursor[0] * 10**12 + _cursor[1]
+
+
+def append_observations(records: List[Dict[str, Any]]) -> None:
+    """Añade un lote de observaciones con una sola escritura al log."""
+    global _cursor
+    if not records:
+        return
+    _ensure_files()
+    lines = [_encode(record) for record in records]
+    with _log_lock, _log_file_lock():
+        _sync_active_segment()
+        before = (_segment_seq(_active_segment), _active_size)
+        _write_lines(lines)
+        # Si el índice estaba al día, se actualiza sin releer; si no, lo hará _catch_up_locked.
+        if _index is not None and _cursor == before:
+            for record in records:
+                _index.add(record)
+            _cursor = (_segment_seq(_active_segment), _active_size)
+
+
+def log_size_bytes() -> int:
+    """Tamaño en disco del histórico de observaciones."""
+    return sum(path.stat().st_size for path in _segments())
+
+
+def read_changes(cursor: Cursor | None) -> Tuple[List[Dict[str, Any]], Cursor, bool]:
+    """Observaciones escritas desde `cursor` (None = desde el principio).
+
+    Devuelve (observaciones, cursor nuevo, reset); reset indica que hay que
+    descartar lo acumulado porque el log se leyó de nuevo desde el principio.
+    """
     _ensure_files()
-    data: List[Dict[str, Any]] = json.loads(OBS_FILE.read_text(encoding="utf-8"))
-    data.append(record)
-    if len(data) > max_records:
-        data = data[-max_records:]
-    OBS_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    reset = cursor is None
+    position = cursor or (0, 0)
+    records: List[Dict[str, Any]] = []
+    for position, chunk in _read_from(position):
+        records.extend(chunk)
+    return records, position, reset
 
 
 def clear_observations() -> None:
     """Borra el histórico de observaciones."""
+    global _active_segment, _active_size, _index, _cursor
     _ensure_files()
-    OBS_FILE.write_text("[]", encoding="utf-8")
+    with _log_lock, _log_file_lock():
+        for segment in _segments():
+            segment.unlink(missing_ok=True)
+        _active_segment = None
+        _active_size = 0
+        _index = None
+        _cursor = (0, 0)
+
+
+def _matches(
+    item: Dict[str, Any],
+    plant_config_id: str | None,
+    plant_type: str | None,
+    since: float | None = None,
+    until: float | None = None,
+    device_id: str | None = None,
+) -> bool:
+    if device_id and item.get("deviceId") != device_id:
+        return False
+    if plant_config_id and item.get("plantConfigId") != plant_config_id:
+        return False
+    if plant_type and item.get("plantType") != plant_type:
+        return False
+    if since is not None or until is not None:
+        try:
+            key = timestamp_key(item.get("timestamp"))
+        except ValueError:
+            return False
+        if since is not None and key < since:
+            return False
+        if until is not None and key > until:
+            return False
+    return True
 
 
 def load_observations(
     limit: int | None = None,
     plant_config_id: str | None = None,
     plant_type: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    device_id: str | None = None,
 ) -> List[Dict[str, Any]]:
+    """Observaciones filtradas (orden cronológico), servidas desde el índice en memoria.
+
+    `since`/`until` son timestamps ISO 8601 inclusivos. Sólo se lee el log en disco
+    si la consulta alcanza observaciones que ya salieron del índice.
+    """
     _ensure_files()
-    data: List[Dict[str, Any]] = json.loads(OBS_FILE.read_text(encoding="utf-8"))
-    if plant_config_id:
-        data = [item for item in data if item.get("plantConfigId") == plant_config_id]
-    if plant_type:
-        data = [item for item in data if item.get("plantType") == plant_type]
-    return data[-limit:] if limit else data
+    since_key = timestamp_key(since) if since else None
+    until_key = timestamp_key(until) if until else None
+    with _log_lock:
+        cached = _get_index().query(limit, plant_config_id, plant_type, since_key, until_key, device_id)
+    if cached is not None:
+        return cached
+
+    # El log está en orden de escritura y las lecturas pueden llegar desordenadas:
+    # se recorre entero y se ordena por timestamp, como el índice y SQLite.
+    matches = _keyed_matches(plant_config_id, plant_type, since_key, until_key, device_id)
+    if limit:
+        ordered = heapq.nlargest(limit, matches)
+        ordered.reverse()
+    else:
+        ordered = sorted(matches)
+    return [item for _, _, item in ordered]
+
+
+def _keyed_matches(
+    plant_config_id: str | None,
+    plant_type: str | None,
+    since: float | None,
+    until: float | None,
+    device_id: str | None,
+) -> Iterator[Tuple[float, int, Dict[str, Any]]]:
+    """(timestamp, posición, observación) de las que cumplen el filtro; la posición desempata."""
+    latest = 0.0
+    for position, item in enumerate(iter_log_observations()):
+        try:
+            key = timestamp_key(item.get("timestamp"))
+        except ValueError:
+            # Sin timestamp válido cuenta como la más reciente, como en ObservationIndex.add.
+            key = latest
+        latest = max(latest, key)
+        if _matches(item, plant_config_id, plant_type, since, until, device_id):
+            yield key, position, item
 
 
 def save_config(config: Dict[str, Any]) -> Dict[str, Any]:
     _ensure_files()
-    merged = load_config()
-    merged.update(config)
-    CFG_FILE.write_text(json.dumps(merged, indent=2), encoding="utf-8")
-    return merged
+    with _config_file_lock():
+        # Se relee bajo el lock: otro worker pudo escribir hace menos de CONFIG_CHECK_INTERVAL.
+        merged = dict(_config_cache.refresh(CFG_FILE))
+        merged.update(config)
+        _config_cache.write(CFG_FILE, merged)
+    return dict(merged)
 
 
 def load_config() -> Dict[str, Any]:
     _ensure_files()
-    return json.loads(CFG_FILE.read_text(encoding="utf-8"))
+    return dict(_config_cache.read(CFG_FILE))
 
 
 def load_plant_configs() -> List[Dict[str, Any]]:
     _ensure_files()
-    return json.loads(PLANT_CFGS_FILE.read_text(encoding="utf-8"))
+    return list(_plant_configs_cache.read(PLANT_CFGS_FILE))
 
 
 def add_plant_config(cfg: Dict[str, Any]) -> Dict[str, Any]:
     _ensure_files()
-    data: List[Dict[str, Any]] = load_plant_configs()
-    data.append(cfg)
-    PLANT_CFGS_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    with _config_file_lock():
+        data: List[Dict[str, Any]] = list(_plant_configs_cache.refresh(PLANT_CFGS_FILE))
+        data.append(cfg)
+        _plant_configs_cache.write(PLANT_CFGS_FILE, data)
     return cfg
 
 
 def get_plant_config(cfg_id: str) -> Dict[str, Any] | None:
-    for item in load_plant_configs():
-        if item.get("id") == cfg_id:
-            return item
-    return None
+    _ensure_files()
+    _plant_configs_cache.read(PLANT_CFGS_FILE)
+    item = _plant_configs_cache.index.get(cfg_id)
+    return dict(item) if item is not None else None
+
+
+def load_devices() -> List[Dict[str, Any]]:
+    _ensure_files()
+    return [dict(item) for item in _devices_cache.read(DEVICES_FILE)]
+
+
+def get_device(device_id: str) -> Dict[str, Any] | None:
+    """Entrada del registro de dispositivos, servida desde la caché en memoria."""
+    _ensure_files()
+    _devices_cache.read(DEVICES_FILE)
+    item = _devices_cache.index.get(device_id)
+    return dict(item) if item is not None else None
+
+
+def register_device(device: Dict[str, Any], max_devices: int | None = None) -> Dict[str, Any] | None:
+    """Añade el dispositivo si no existe; si ya estaba registrado devuelve la entrada existente.
+
+    Con `max_devices`, devuelve None en lugar de añadirlo si el registro ya está lleno.
+    """
+    _ensure_files()
+    with _config_file_lock():
+        data: List[Dict[str, Any]] = list(_devices_cache.refresh(DEVICES_FILE))
+        existing = _devices_cache.index.get(device["id"])
+        if existing is not None:
+            return dict(existing)
+        if max_devices is not None and len(data) >= max_devices:
+            return None
+        data.append(device)
+        _devices_cache.write(DEVICES_FILE, data)
+    return dict(device)
+
+
+def update_device(device_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Actualiza (o crea) la entrada del dispositivo con `changes`."""
+    _ensure_files()
+    with _config_file_lock():
+        data: List[Dict[str, Any]] = list(_devices_cache.refresh(DEVICES_FILE))
+        existing = _devices_cache.index.get(device_id)
+        merged = {**(existing or {}), **changes, "id": device_id}
+        if existing is None:
+            data.append(merged)
+        else:
+            data = [merged if item.get("id") == device_id else item for item in data]
+        _devices_cache.write(DEVICES_FILE, data)
+    return dict(merged)
+
 
+if STORAGE_BACKEND == "sqlite":
+    # Misma API pública, resuelta contra SQLite (WAL) con índices por (clave, timestamp).
+    from services.sqlite_storage import (  # noqa: E402,F811
+        add_plant_config,
+        append_observation,
+        append_observations,
+        clear_observations,
+        get_device,
+        get_plant_config,
+        invalidate_config_cache,
+        load_config,
+        load_devices,
+        load_observations,
+        load_plant_configs,
+        log_size_bytes,
+        observations_version,
+        read_changes,
+        register_device,
+        save_config,
+        update_device,
+    )
+elif STORAGE_BACKEND != "files":
+    raise ValueError(f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND}")
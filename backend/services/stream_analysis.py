@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.recommendations import FEATURES, RangeTuple, compile_ranges
+from services.observation_cache import timestamp_key
+
+MEASUREMENTS = ("temperature", "humidity", "illuminance")
+# Peso de cada lectura nueva en la media y varianza exponenciales.
+ALPHA = float(os.getenv("ANALYSIS_ALPHA", "0.1"))
+# Peso de cada pendiente nueva en la tasa de cambio suavizada.
+RATE_ALPHA = float(os.getenv("ANALYSIS_RATE_ALPHA", "0.2"))
+Z_THRESHOLD = float(os.getenv("ANALYSIS_Z_THRESHOLD", "3"))
+# Lecturas antes de marcar anomalías o tendencias en una serie nueva.
+WARMUP = int(os.getenv("ANALYSIS_WARMUP", "10"))
+# Lecturas consecutivas necesarias para levantar o retirar una alerta.
+DEBOUNCE = max(int(os.getenv("ANALYSIS_DEBOUNCE", "3")), 1)
+# Se avisa de una tendencia si, al ritmo actual, se sale del rango antes de este plazo.
+TREND_HORIZON_HOURS = float(os.getenv("ANALYSIS_TREND_HORIZON_HOURS", "6"))
+# Plantas con estado en memoria; la clave viene del cliente, así que se acota (LRU).
+MAX_SERIES = int(os.getenv("ANALYSIS_MAX_SERIES", "1000"))
+# Desviación mínima para el z-score: el DHT11 da valores enteros, así que una serie
+# estable tendría desviación ~0 y cualquier paso de cuantización parecería un pico.
+MIN_STD = {"temperature": 0.5, "humidity": 1.0, "illuminance": 1.0}
+
+
+class _Debounce:
+    """Estado (None, "low" o "high") que sólo cambia tras DEBOUNCE lecturas seguidas que lo contradicen."""
+
+    __slots__ = ("state", "since", "candidate", "streak")
+
+    def __init__(self) -> None:
+        self.state: Optional[str] = None
+        self.since: Optional[str] = None
+        self.candidate: Optional[str] = None
+        self.streak = 0
+
+    def update(self, condition: Optional[str], timestamp: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """Devuelve (anterior, nuevo) cuando el estado cambia."""
+        if condition == self.state:
+            self.streak = 0
+            return None
+        if condition != self.candidate:
+            self.candidate = condition
+            self.streak = 0
+        self.streak += 1
+        if self.streak < DEBOUNCE:
+            return None
+        previous, self.state, self.since = self.state, condition, timestamp
+        self.streak = 0
+        return previous, condition
+
+
+class _Series:
+    """Estadísticos exponenciales de una medida; cada lectura se incorpora en O(1)."""
+
+    __slots__ = ("min_std", "count", "mean", "var", "rate", "last_ts", "range_alert", "trend_alert")
+
+    def __init__(self, min_std: float) -> None:
+        self.min_std = min_std
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.rate = 0.0
+        self.last_ts: Optional[float] = None
+        self.range_alert = _Debounce()
+        self.trend_alert = _Debounce()
+
+    def update(self, value: float, ts: Optional[float]) -> Tuple[float, bool]:
+        """Incorpora la lectura y devuelve (z-score respecto al estado previo, es anómala)."""
+        if self.count == 0:
+            self.count, self.mean, self.last_ts = 1, value, ts
+            return 0.0, False
+        std = max(math.sqrt(self.var), self.min_std)
+        z_score = (value - self.mean) / std
+        anomalous = self.count >= WARMUP and abs(z_score) > Z_THRESHOLD
+        # Las lecturas anómalas se recortan a mean ± Z·std: un pico aislado apenas mueve
+        # la media, pero un cambio de nivel sostenido acaba arrastrándola.
+        if anomalous:
+            value = self.mean + math.copysign(Z_THRESHOLD * std, z_score)
+        previous_mean = self.mean
+        diff = value - self.mean
+        increment = ALPHA * diff
+        self.mean += increment
+        self.var = (1 - ALPHA) * (self.var + diff * increment)
+        if ts is not None and self.last_ts is not None and ts > self.last_ts:
+            slope = (self.mean - previous_mean) / (ts - self.last_ts) * 3600
+            self.rate = slope if self.count == 1 else self.rate + RATE_ALPHA * (slope - self.rate)
+        if ts is not None and (self.last_ts is None or ts > self.last_ts):
+            self.last_ts = ts
+        self.count += 1
+        return z_score, anomalous
+
+    def trend(self, low: float, high: float) -> Tuple[Optional[str], Optional[float]]:
+        """Dirección y horas hasta salir de [low, high] al ritmo actual, si es antes del horizonte."""
+        if self.count < WARMUP or not low <= self.mean <= high:
+            return None, None
+        if self.rate < 0:
+            direction, eta = "low", (self.mean - low) / -self.rate
+        elif self.rate > 0:
+            direction, eta = "high", (high - self.mean) / self.rate
+        else:
+            return None, None
+        if eta > TREND_HORIZON_HOURS:
+            return None, None
+        return direction, round(eta, 2)
+
+
+def _status(value: float, low: float, high: float) -> Optional[str]:
+    if value < low:
+        return "low"
+    if value > high:
+        return "high"
+    return None
+
+
+class StreamAnalyzer:
+    """Detección incremental de anomalías y tendencias por planta sobre el flujo de ingesta.
+
+    Cada serie (planta × medida) mantiene una media y varianza exponenciales
+    (EWMA), el z-score de cada lectura y la tasa de cambio suavizada, sin releer
+    el histórico. Las alertas de rango y de tendencia se levantan y retiran sólo
+    tras ANALYSIS_DEBOUNCE lecturas consecutivas, así un pico aislado no dispara
+    una alerta. El estado vive en memoria del proceso, para las últimas
+    ANALYSIS_MAX_SERIES plantas que enviaron lecturas.
+    """
+
+    def __init__(self, max_series: int | None = None) -> None:
+        self.max_series = max(max_series if max_series is not None else MAX_SERIES, 1)
+        self._series: OrderedDict[str, Dict[str, _Series]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stream_key(observation: Dict[str, Any]) -> str:
+        if observation.get("deviceId"):
+            return f"device:{observation['deviceId']}"
+        if observation.get("plantConfigId"):
+            return f"config:{observation['plantConfigId']}"
+        return f"plant:{observation.get('plantName')}"
+
+    def update(self, observation: Dict[str, Any], ranges: Optional[RangeTuple] = None) -> Dict[str, Any]:
+        """Incorpora una lectura; devuelve estadísticos, anomalías, alertas activas y cambios de alerta."""
+        key = self.stream_key(observation)
+        try:
+            ts: Optional[float] = timestamp_key(observation.get("timestamp"))
+        except ValueError:
+            ts = None
+        timestamp = observation.get("timestamp")
+        bounds = ranges or compile_ranges(None)
+        features: Dict[str, Any] = {}
+        events: List[Dict[str, Any]] = []
+        with self._lock:
+            by_measurement = self._series.get(key)
+            if by_measurement is None:
+                by_measurement = self._series[key] = {}
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+            else:
+                self._series.move_to_end(key)
+            for measurement, feature, (low, high) in zip(MEASUREMENTS, FEATURES, bounds):
+                value = observation.get(measurement)
+                if not isinstance(value, (int, float)):
+                    continue
+                series = by_measurement.get(measurement)
+                if series is None:
+                    series = by_measurement[measurement] = _Series(MIN_STD[measurement])
+                z_score, anomalous = series.update(float(value), ts)
+                status = _status(float(value), low, high)
+                # La tendencia es una predicción: sólo tiene sentido mientras la lectura está en rango.
+                direction, eta = series.trend(low, high) if status is None else (None, None)
+                for kind, debounce, condition in (
+                    ("range", series.range_alert, status),
+                    ("trend", series.trend_alert, direction),
+                ):
+                    change = debounce.update(condition, timestamp)
+                    if change is not None:
+                        events.append(
+                            {
+                                "feature": feature,
+                                "kind": kind,
+                                "status": change[1] or "ok",
+                                "previous": change[0] or "ok",
+                                "timestamp": timestamp,
+                            }
+                        )
+                features[feature] = {
+                    **self._stats(series),
+                    "zScore": round(z_score, 3),
+                    "anomaly": anomalous,
+                    "trend": direction,
+                    "etaHours": eta,
+                }
+            alerts = self._alerts(by_measurement)
+        return {"key": key, "features": features, "alerts": alerts, "events": events}
+
+    def snapshot(self, key: str | None = None) -> List[Dict[str, Any]]:
+        """Estado actual de cada planta (o sólo de `key`)."""
+        with self._lock:
+            keys = [key] if key else sorted(self._series)
+            return [
+                {
+                    "key": item,
+                    "features": {
+                        feature: self._stats(self._series[item][measurement])
+                        for measurement, feature in zip(MEASUREMENTS, FEATURES)
+                        if measurement in self._series[item]
+                    },
+                    "alerts": self._alerts(self._series[item]),
+                }
+                for item in keys
+                if item in self._series
+            ]
+
+    @staticmethod
+    def _stats(series: _Series) -> Dict[str, Any]:
+        return {
+            "count": series.count,
+            "ewma": round(series.mean, 3),
+            "std": round(math.sqrt(series.var), 3),
+            "ratePerHour": round(series.rate, 3),
+        }
+
+    @staticmethod
+    def _alerts(by_measurement: Dict[str, _Series]) -> List[Dict[str, Any]]:
+        alerts = []
+        for measurement, feature in zip(MEASUREMENTS, FEATURES):
+            series = by_measurement.get(measurement)
+            if series is None:
+                continue
+            for kind, debounce in (("range", series.range_alert), ("trend", series.trend_alert)):
+                if debounce.state is not None:
+                    alerts.append(
+                        {"feature": feature, "kind": kind, "status": debounce.state, "since": debounce.since}
+                    )
+        return alerts
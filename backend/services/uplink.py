@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import math
+import struct
+import time
+from typing import Any, Dict, Iterable, List
+
+from services.observation_cache import timestamp_key
+
+# Formato binario compacto para el uplink de los nodos (HTTP y MQTT).
+#
+# Cabecera (little-endian):
+#   B  versión (1 o 2)
+#   B  número de muestras (1-255)
+#   I  timestamp de envío en segundos epoch UTC (0 = hora de recepción en el backend)
+#   B  longitud del deviceId en bytes (0 = sin deviceId)
+#   I  sólo v2: identificador del mensaje (idempotencia de reintentos)
+# seguida del deviceId en UTF-8.
+# Cada muestra (10 bytes):
+#   H  antigüedad en segundos respecto al envío
+#   h  temperatura en centésimas de °C
+#   H  humedad en centésimas de %
+#   f  iluminancia (float32)
+CONTENT_TYPE = "application/vnd.smartplant.uplink"
+# Los mensajes MQTT binarios se publican en <topic>/bin.
+MQTT_TOPIC_SUFFIX = "/bin"
+VERSION = 1
+VERSION_MESSAGE_ID = 2
+MAX_SAMPLES = 255
+
+_HEADER = struct.Struct("<BBIB")
+_MESSAGE_ID = struct.Struct("<I")
+_SAMPLE = struct.Struct("<HhHf")
+# strftime sobre gmtime es ~2x más rápido que datetime.isoformat (resolución de segundos).
+_ISO_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+
+def decode(data: bytes, received_at: float | None = None) -> List[Dict[str, Any]]:
+    """Lecturas de un mensaje binario, con las mismas claves que el JSON del POST."""
+    if len(data) < _HEADER.size:
+        raise ValueError("Mensaje binario truncado")
+    version, count, sent_at, id_length = _HEADER.unpack_from(data)
+    if version not in (VERSION, VERSION_MESSAGE_ID):
+        raise ValueError(f"Versión de formato binario no soportada: {version}")
+    offset = _HEADER.size
+    message_id = 0
+    if version == VERSION_MESSAGE_ID:
+        if len(data) < offset + _MESSAGE_ID.size:
+            raise ValueError("Mensaje binario truncado")
+        (message_id,) = _MESSAGE_ID.unpack_from(data, offset)
+        offset += _MESSAGE_ID.size
+    start = offset + id_length
+    if not count or len(data) != start + count * _SAMPLE.size:
+        raise ValueError("Longitud de mensaje binario inválida")
+    try:
+        device_id = bytes(data[offset:start]).decode("utf-8") if id_length else None
+    except UnicodeDecodeError:
+        raise ValueError("deviceId inválido")
+    sent_at = sent_at or int(received_at if received_at is not None else time.time())
+
+    rows = list(_SAMPLE.iter_unpack(memoryview(data)[start:]))
+    if not all(math.isfinite(row[3]) for row in rows):
+        raise ValueError("Campo illuminance inválido")
+    gmtime, strftime = time.gmtime, time.strftime
+    readings = [
+        {
+            "temperature": temperature / 100,
+            "humidity": humidity / 100,
+            "illuminance": illuminance,
+            "timestamp": strftime(_ISO_FORMAT, gmtime(sent_at - age)),
+        }
+        for age, temperature, humidity, illuminance in rows
+    ]
+    if device_id:
+        for reading in readings:
+            reading["deviceId"] = device_id
+    if message_id:
+        # Un id por lectura: el del mensaje más la posición de la muestra.
+        for position, reading in enumerate(readings):
+            reading["messageId"] = f"{message_id:08x}.{position}"
+    return readings
+
+
+def encode(
+    readings: Iterable[Dict[str, Any]],
+    device_id: str | None = None,
+    sent_at: int | None = None,
+    message_id: int | None = None,
+) -> bytes:
+    """Codifica lecturas en el formato binario (referencia para firmware y pruebas).
+
+    Con `message_id` (u32 distinto de 0) se usa la versión 2 de la cabecera.
+    """
+    readings = list(readings)
+    if not 0 < len(readings) <= MAX_SAMPLES:
+        raise ValueError(f"Un mensaje binario lleva entre 1 y {MAX_SAMPLES} lecturas")
+    sent_at = int(sent_at if sent_at is not None else time.time())
+    device = device_id.encode("utf-8") if device_id else b""
+    version = VERSION_MESSAGE_ID if message_id else VERSION
+    parts = [_HEADER.pack(version, len(readings), sent_at, len(device))]
+    if message_id:
+        parts.append(_MESSAGE_ID.pack(message_id))
+    parts.append(device)
+    for reading in readings:
+        timestamp = reading.get("timestamp")
+        age = max(int(round(sent_at - timestamp_key(timestamp))), 0) if timestamp else 0
+        parts.append(
+            _SAMPLE.pack(
+                min(age, 0xFFFF),
+                round(float(reading["temperature"]) * 100),
+                round(float(reading["humidity"]) * 100),
+                float(reading["illuminance"]),
+            )
+        )
+    return b"".join(parts)
@@ -0,0 +1,406 @@
+"""Benchmarks de las rutas críticas de ingesta, consulta y exportación RDF.
+
+Cada ejecución trabaja sobre un directorio de datos temporal que se rellena con
+observaciones sintéticas (1k, 100k o 1M) antes de medir. Para cada escenario se
+informa throughput y latencias p50/p99; con --output se guardan los resultados
+en JSON y con --compare se contrastan contra una ejecución anterior.
+
+Uso:
+    python tools/benchmark.py --size 1k
+    python tools/benchmark.py --size 100k --output bench-main.json
+    python tools/benchmark.py --size 100k --compare bench-main.json --threshold 15
+    python tools/benchmark.py --list
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+PLANT_TYPES = ("monstera-deliciosa", "ficus-lyrata", "pothos")
+CONFIG_IDS = tuple(f"bench-{i}" for i in range(8))
+# El grafo en memoria no se rellena por encima de este número de lecturas (3 observaciones RDF cada una).
+RDF_PREFILL_MAX = 20_000
+# Triples de una lectura completa: 10 por medida (observación + resultado).
+TRIPLES_PER_READING = 30
+# Diferencias de p99 por debajo de esto son ruido de medida, no regresiones.
+MIN_P99_DELTA_MS = 0.05
+
+
+def generate_observations(count: int, seed: int = 42, start: datetime | None = None) -> Iterator[Dict[str, Any]]:
+    """Lecturas sintéticas deterministas, una por minuto y repartidas entre varias configuraciones."""
+    rng = random.Random(seed)
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        yield {
+            "plantName": f"Planta {i % len(CONFIG_IDS)}",
+            "location": "Laboratorio",
+            "plantType": PLANT_TYPES[i % len(PLANT_TYPES)],
+            "plantConfigId": CONFIG_IDS[i % len(CONFIG_IDS)],
+            "temperature": round(rng.uniform(12, 34), 2),
+            "humidity": round(rng.uniform(20, 90), 2),
+            "illuminance": round(rng.uniform(50, 20000), 1),
+            "timestamp": (start + timedelta(minutes=i)).isoformat(),
+        }
+
+
+def _isolate(data_dir: Path) -> None:
+    """Redirige todos los ficheros de datos del backend al directorio temporal."""
+    os.environ.setdefault("MQTT_ENABLED", "false")
+    os.environ.setdefault("RDF_LOAD_MODE", "eager")
+    os.environ.setdefault("STORAGE_DB_PATH", str(data_dir / "smartplant.sqlite"))
+    shutil.copy(BACKEND_DIR / "data" / "plants.json", data_dir / "plants.json")
+
+    from services import plants, semantic_store, storage
+
+    storage.DATA_DIR = data_dir
+    storage.OBS_FILE = data_dir / "observations.json"
+    storage.OBS_LOG_DIR = data_dir / "observations"
+    storage.CFG_FILE = data_dir / "config.json"
+    storage.PLANT_CFGS_FILE = data_dir / "plant_configs.json"
+    storage.DEVICES_FILE = data_dir / "devices.json"
+    semantic_store.DATA_DIR = data_dir
+    semantic_store.RDF_FILE = data_dir / "observations.ttl"
+    plants.PLANT_FILE = data_dir / "plants.json"
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _measure(
+    func: Callable[[int], Any], iterations: int, items_per_call: int = 1, warmup: int = 3
+) -> Dict[str, float]:
+    # Las primeras llamadas construyen índices y cachés; no se cuentan.
+    for i in range(warmup):
+        func(iterations + i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - call_started)
+    total = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "seconds": round(total, 4),
+        "opsPerSecond": round(iterations * items_per_call / total, 1) if total else 0.0,
+        "p50Ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p99Ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "meanMs": round(statistics.fmean(latencies) * 1000, 3),
+    }
+
+
+class Benchmarks:
+    """Escenarios sobre un backend ya poblado. Cada método `bench_*` es un escenario."""
+
+    def __init__(self, size: int, iterations: int, rdf_max: int = RDF_PREFILL_MAX) -> None:
+        import app as backend_app
+        from services import recommendations, storage
+        from services.semantic_store import SemanticStore
+
+        self.app = backend_app
+        self.storage = storage
+        self.recommendations = recommendations
+        self.SemanticStore = SemanticStore
+        self.client = backend_app.app.test_client()
+        self.size = size
+        self.iterations = iterations
+        self.rdf_max = rdf_max
+        future = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        self.samples = list(generate_observations(max(iterations, 1000), seed=7, start=future))
+        self.last_timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=size)
+
+    def prefill(self) -> Dict[str, float]:
+        started = time.perf_counter()
+        batch: List[Dict[str, Any]] = []
+        for record in generate_observations(self.size):
+            batch.append(record)
+            if len(batch) >= 10_000:
+                self.storage.append_observations(batch)
+                batch = []
+        if batch:
+            self.storage.append_observations(batch)
+        storage_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rdf_items = [
+            (
+                {key: record[key] for key in ("temperature", "humidity", "illuminance")},
+                {key: record[key] for key in ("plantName", "location", "timestamp", "plantType")},
+            )
+            for record in generate_observations(min(self.size, self.rdf_max))
+        ]
+        for offset in range(0, len(rdf_items), 1000):
+            self.app.semantic_store.add_observations(rdf_items[offset : offset + 1000])
+        return {
+            "storageSeconds": round(storage_seconds, 3),
+            "rdfSeconds": round(time.perf_counter() - started, 3),
+            "rdfTriples": len(self.app.semantic_store.graph),
+        }
+
+    def _sample(self, i: int) -> Dict[str, Any]:
+        record = dict(self.samples[i % len(self.samples)])
+        record.pop("plantConfigId")
+        record["timestamp"] = (self.last_timestamp + timedelta(seconds=i)).isoformat()
+        return record
+
+    def bench_ingest_http(self) -> Dict[str, float]:
+        """POST /api/observations completo (validación, log, RDF, recomendaciones)."""
+        return _measure(lambda i: self.client.post("/api/observations", json=self._sample(i)), self.iterations)
+
+    def bench_ingest_batch_http(self) -> Dict[str, float]:
+        """POST /api/observations/batch con lotes de 100 lecturas."""
+        batches = max(self.iterations // 100, 5)
+        return _measure(
+            lambda i: self.client.post(
+                "/api/observations/batch", json=[self._sample(i * 100 + j + 10**6) for j in range(100)]
+            ),
+            batches,
+            items_per_call=100,
+        )
+
+    def _uplink_readings(self) -> List[Dict[str, Any]]:
+        return [
+            {key: record[key] for key in ("temperature", "humidity", "illuminance", "timestamp")}
+            for record in self.samples[:10]
+        ]
+
+    def bench_uplink_decode_json(self) -> Dict[str, float]:
+        """Decodificación de un mensaje JSON de 10 lecturas (payload MQTT)."""
+        payload = json.dumps(self._uplink_readings()).encode("utf-8")
+        return _measure(lambda i: json.loads(payload.decode("utf-8")), self.iterations * 10, items_per_call=10)
+
+    def bench_uplink_decode_binary(self) -> Dict[str, float]:
+        """uplink.decode de un mensaje binario de 10 lecturas (payload MQTT)."""
+        from services import uplink
+
+        payload = uplink.encode(self._uplink_readings(), device_id="bench-node")
+        return _measure(lambda i: uplink.decode(payload), self.iterations * 10, items_per_call=10)
+
+    def bench_storage_latest(self) -> Dict[str, float]:
+        """storage.load_observations(limit=10) servido desde el índice en memoria."""
+        return _measure(lambda i: self.storage.load_observations(limit=10), self.iterations)
+
+    def bench_storage_latest_by_config(self) -> Dict[str, float]:
+        """storage.load_observations(limit=50, plant_config_id=...)."""
+        return _measure(
+            lambda i: self.storage.load_observations(limit=50, plant_config_id=CONFIG_IDS[i % len(CONFIG_IDS)]),
+            self.iterations,
+        )
+
+    def bench_storage_range(self) -> Dict[str, float]:
+        """storage.load_observations con since/until de una hora."""
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        span = max(self.size - 60, 1)
+
+        def query(i: int) -> None:
+            start = base + timedelta(minutes=(i * 7919) % span)
+            self.storage.load_observations(since=start.isoformat(), until=(start + timedelta(hours=1)).isoformat())
+
+        return _measure(query, max(self.iterations // 10, 10))
+
+    def bench_http_latest(self) -> Dict[str, float]:
+        """GET /api/recommendations/latest sin ETag."""
+        return _measure(lambda i: self.client.get("/api/recommendations/latest"), self.iterations)
+
+    def bench_semantic_add(self) -> Dict[str, float]:
+        """SemanticStore.add_observation (incluye journal en disco)."""
+        store = self.app.semantic_store
+
+        def add(i: int) -> None:
+            record = self._sample(i + 2 * 10**6)
+            store.add_observation(
+                {key: record[key] for key in ("temperature", "humidity", "illuminance")},
+                {key: record[key] for key in ("plantName", "location", "timestamp", "plantType")},
+            )
+
+        return _measure(add, self.iterations)
+
+    def bench_semantic_add_batch(self) -> Dict[str, float]:
+        """SemanticStore.add_observations de 10 lecturas (ops/s = triples/s; journal sin compactar)."""
+        store = self.app.semantic_store
+
+        def add(i: int) -> None:
+            records = [self._sample(i * 10 + offset + 3 * 10**6) for offset in range(10)]
+            store.add_observations(
+                [
+                    (
+                        {key: record[key] for key in ("temperature", "humidity", "illuminance")},
+                        {key: record[key] for key in ("plantName", "location", "timestamp", "plantType")},
+                    )
+                    for record in records
+                ]
+            )
+
+        # La compactación a Turtle cuesta segundos y taparía el coste de construir e insertar.
+        compact_every, store.compact_every = store.compact_every, 0
+        try:
+            return _measure(add, self.iterations, items_per_call=10 * TRIPLES_PER_READING)
+        finally:
+            store.compact_every = compact_every
+
+    def bench_semantic_serialize(self) -> Dict[str, float]:
+        """SemanticStore.serialize a Turtle del grafo completo."""
+        return _measure(lambda i: self.app.semantic_store.serialize("text/turtle"), 3, warmup=1)
+
+    def bench_semantic_subgraph(self) -> Dict[str, float]:
+        """SemanticStore.subgraph(limit=20) con el índice temporal."""
+        return _measure(lambda i: self.app.semantic_store.subgraph(limit=20), max(self.iterations // 10, 10))
+
+    def bench_semantic_cold_load(self) -> Dict[str, float]:
+        """Carga del grafo desde disco (arranque de un worker)."""
+        self.app.semantic_store.compact()
+        return _measure(lambda i: self.SemanticStore(load="eager").close(), 3, warmup=0)
+
+    def bench_recommendations(self) -> Dict[str, float]:
+        """recommendations.build_recommendations con rangos precompilados."""
+        from services import plants
+
+        profile = plants.get_profile(PLANT_TYPES[0])
+        ranges = plants.get_ranges(PLANT_TYPES[0])
+        build = self.recommendations.build_recommendations
+        samples = self.samples
+        return _measure(lambda i: build(samples[i % len(samples)], profile, ranges), self.iterations * 10)
+
+    def bench_stream_analysis(self) -> Dict[str, float]:
+        """StreamAnalyzer.update (EWMA, z-score, tendencia y alertas) por lectura."""
+        from services import plants
+        from services.stream_analysis import StreamAnalyzer
+
+        analyzer = StreamAnalyzer()
+        ranges = plants.get_ranges(PLANT_TYPES[0])
+        samples = self.samples
+        return _measure(lambda i: analyzer.update(samples[i % len(samples)], ranges), self.iterations * 10)
+
+    @classmethod
+    def scenarios(cls) -> Dict[str, Callable[["Benchmarks"], Dict[str, float]]]:
+        return {name[len("bench_") :]: func for name, func in vars(cls).items() if name.startswith("bench_")}
+
+
+def _delta(value: float, base: float) -> float:
+    return (value - base) / base * 100 if base else 0.0
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Imprime la comparación y devuelve los escenarios que empeoraron más de `threshold` %."""
+    regressions = []
+    print(f"\nComparación con {baseline.get('label') or baseline.get('startedAt')} (umbral {threshold:.0f} %)")
+    print(
+        f"{'escenario':<26}{'ops/s base':>12}{'ops/s':>12}{'Δ ops/s':>10}"
+        f"{'p99 base':>11}{'p99':>11}{'Δ p99':>9}"
+    )
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        delta_ops = _delta(result["opsPerSecond"], base["opsPerSecond"])
+        delta_p99 = _delta(result["p99Ms"], base["p99Ms"])
+        flag = ""
+        p99_worse = delta_p99 > threshold and result["p99Ms"] - base["p99Ms"] > MIN_P99_DELTA_MS
+        if delta_ops < -threshold or p99_worse:
+            regressions.append(name)
+            flag = "  <-- regresión"
+        print(
+            f"{name:<26}{base['opsPerSecond']:>12.1f}{result['opsPerSecond']:>12.1f}{delta_ops:>9.1f}%"
+            f"{base['p99Ms']:>10.2f}ms{result['p99Ms']:>9.2f}ms{delta_p99:>8.1f}%{flag}"
+        )
+    return regressions
+
+
+def main() -> int:
+    scenarios = Benchmarks.scenarios()
+    parser = argparse.ArgumentParser(description="Benchmarks de SmartPlant")
+    parser.add_argument("--size", choices=list(SIZES), default="1k", help="Observaciones precargadas")
+    parser.add_argument("--iterations", type=int, default=500, help="Repeticiones por escenario")
+    parser.add_argument(
+        "--only", action="append", choices=list(scenarios), help="Escenarios a ejecutar (repetible)"
+    )
+    parser.add_argument(
+        "--rdf-max",
+        type=int,
+        default=RDF_PREFILL_MAX,
+        help=f"Lecturas máximas precargadas en el grafo (~{TRIPLES_PER_READING} triples cada una)",
+    )
+    parser.add_argument("--output", help="Guarda los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="Empeoramiento (%%) que se marca como regresión"
+    )
+    parser.add_argument("--label", help="Etiqueta de la ejecución (p. ej. rama o commit)")
+    parser.add_argument("--list", action="store_true", help="Lista los escenarios y termina")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, func in scenarios.items():
+            print(f"{name:<26}{(func.__doc__ or '').strip()}")
+        return 0
+
+    data_dir = Path(tempfile.mkdtemp(prefix="smartplant-bench-"))
+    try:
+        _isolate(data_dir)
+        bench = Benchmarks(SIZES[args.size], args.iterations, args.rdf_max)
+        print(f"Precargando {bench.size} observaciones en {data_dir} ...")
+        prefill = bench.prefill()
+        print(
+            f"Precarga: log {prefill['storageSeconds']} s, RDF {prefill['rdfSeconds']} s "
+            f"({prefill['rdfTriples']} triples)"
+        )
+
+        run: Dict[str, Any] = {
+            "label": args.label,
+            "startedAt": datetime.now(tz=timezone.utc).isoformat(),
+            "size": args.size,
+            "iterations": args.iterations,
+            "rdfMax": args.rdf_max,
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "storageBackend": os.getenv("STORAGE_BACKEND", "files"),
+                "rdfBackend": os.getenv("RDF_BACKEND", "memory"),
+            },
+            "prefill": prefill,
+            "results": {},
+        }
+        print(f"\n{'escenario':<26}{'iter':>7}{'ops/s':>12}{'p50':>11}{'p99':>11}")
+        for name, func in scenarios.items():
+            if args.only and name not in args.only:
+                continue
+            result = func(bench)
+            run["results"][name] = result
+            print(
+                f"{name:<26}{result['iterations']:>7}{result['opsPerSecond']:>12.1f}"
+                f"{result['p50Ms']:>9.3f}ms{result['p99Ms']:>9.3f}ms"
+            )
+        bench.app.semantic_store.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(run, indent=2), encoding="utf-8")
+        print(f"\nResultados guardados en {args.output}")
+    if args.compare:
+        regressions = compare(run, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.threshold)
+        if regressions:
+            print(f"\nRegresiones: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Prueba de carga concurrente contra /api/observations.
+
+Lanza muchas peticiones desde varios hilos (opcionalmente repartidas entre
+varias URLs, una por worker) y comprueba después que no se perdió ninguna
+lectura ni en el log de observaciones ni en el grafo RDF.
+
+Uso:
+    python tools/stress_ingest.py --threads 32 --requests 50
+    python tools/stress_ingest.py --url http://localhost:5001 --url http://localhost:5002 --configs 20
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+from urllib import error, request
+
+SOSA = "http://www.w3.org/ns/sosa/"
+EX = "http://example.org/smartplant/"
+
+
+def _call(method: str, url: str, body: Any = None, content_type: str = "application/json") -> Tuple[int, bytes]:
+    data = None
+    headers = {}
+    if body is not None:
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        headers["Content-Type"] = content_type
+    req = request.Request(url, data=data, headers=headers, method=method)
+    try:
+        with request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except error.HTTPError as exc:
+        return exc.code, exc.read()
+
+
+def _stored_count(base: str, plant_name: str) -> int:
+    status, body = _call("GET", f"{base}/api/observations/latest?limit=0")
+    if status != 200:
+        raise RuntimeError(f"/api/observations/latest respondió {status}")
+    return sum(1 for item in json.loads(body)["items"] if item.get("plantName") == plant_name)
+
+
+def _triple_count(base: str, plant_name: str) -> int:
+    feature = f"{EX}feature/{plant_name.lower().replace(' ', '-')}"
+    query = f"SELECT (COUNT(?o) AS ?n) WHERE {{ ?o <{SOSA}hasFeatureOfInterest> <{feature}> }}"
+    status, body = _call("POST", f"{base}/api/sparql", query.encode("utf-8"), "application/sparql-query")
+    if status != 200:
+        raise RuntimeError(f"/api/sparql respondió {status}: {body[:200]!r}")
+    return int(json.loads(body)["results"]["bindings"][0]["n"]["value"])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", action="append", help="URL base del backend (repetible, una por worker)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=50, help="Peticiones por hilo")
+    parser.add_argument("--configs", type=int, default=0, help="Configuraciones guardadas a crear en paralelo")
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=3.0,
+        help="Segundos de espera antes de verificar con varias URLs (CONFIG_CHECK_INTERVAL)",
+    )
+    args = parser.parse_args()
+
+    urls = [url.rstrip("/") for url in (args.url or ["http://localhost:5000"])]
+    targets = cycle(urls)
+    targets_lock = Lock()
+    plant_name = f"stress-{uuid.uuid4().hex[:8]}"
+    config_ids = [f"{plant_name}-{i}" for i in range(args.configs)]
+    latencies: List[float] = []
+    failures: List[str] = []
+    results_lock = Lock()
+
+    def next_target() -> str:
+        with targets_lock:
+            return next(targets)
+
+    def worker(thread_no: int) -> None:
+        for i in range(args.requests):
+            body: Dict[str, Any] = {
+                "plantName": plant_name,
+                "temperature": round(random.uniform(15, 30), 2),
+                "humidity": round(random.uniform(30, 80), 2),
+                "illuminance": round(random.uniform(100, 2000), 1),
+            }
+            started = time.perf_counter()
+            status, payload = _call("POST", f"{next_target()}/api/observations", body)
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                if status not in (200, 201):
+                    failures.append(f"hilo {thread_no}, petición {i}: {status} {payload[:200]!r}")
+        for cfg_id in config_ids[thread_no :: args.threads]:
+            status, payload = _call("POST", f"{next_target()}/api/plants/configs", {"id": cfg_id})
+            if status != 201:
+                with results_lock:
+                    failures.append(f"config {cfg_id}: {status} {payload[:200]!r}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    expected = args.threads * args.requests
+    latencies.sort()
+    print(f"{expected} peticiones en {elapsed:.2f} s ({expected / elapsed:.1f} req/s) contra {len(urls)} URL(s)")
+    if latencies:
+        print(
+            f"latencia p50={latencies[len(latencies) // 2] * 1000:.1f} ms "
+            f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.1f} ms"
+        )
+
+    ok = not failures
+    if len(urls) > 1 and config_ids:
+        time.sleep(args.settle)
+    for failure in failures[:20]:
+        print(f"ERROR {failure}")
+    for url in urls:
+        stored = _stored_count(url, plant_name)
+        # Cada lectura genera una sosa:Observation por medida (temperatura, humedad y luz).
+        triples = _triple_count(url, plant_name)
+        print(f"{url}: {stored}/{expected} lecturas en el log, {triples}/{expected * 3} observaciones RDF")
+        ok = ok and stored == expected and triples == expected * 3
+        if config_ids:
+            status, body = _call("GET", f"{url}/api/plants/configs")
+            saved = {item.get("id") for item in json.loads(body)} if status == 200 else set()
+            missing = [cfg_id for cfg_id in config_ids if cfg_id not in saved]
+            print(f"{url}: {len(config_ids) - len(missing)}/{len(config_ids)} configuraciones guardadas")
+            ok = ok and not missing
+    print("OK" if ok else "FALLO")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
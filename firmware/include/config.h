@@ -7,6 +7,9 @@ static const char* WIFI_PASS = "1003103288";
 // Envío de datos
 static const bool USE_HTTP = true;
 static const bool USE_MQTT = true;
+// Formato binario compacto (33 bytes por lectura en lugar de ~150 de JSON).
+// Por MQTT se publica en MQTT_TOPIC + "/bin". Ver backend/services/uplink.py.
+static const bool USE_BINARY_UPLINK = false;
 
 // Endpoint del backend Flask (HTTP)
 static const char* BACKEND_URL = "http://192.168.101.7:5000/api/observations";
@@ -19,6 +22,10 @@ static const char* MQTT_TOPIC = "smartplant/observations";
 static const char* MQTT_USER = "";  // opcional
 static const char* MQTT_PASS = "";  // opcional
 
+// Identificador del nodo (deviceId). Vacío = la MAC Wi-Fi en hexadecimal, única por placa.
+// El backend lo usa para asociar el nodo a una planta y para descartar reentregas.
+static const char* DEVICE_ID = "";
+
 // Metadatos de la planta
 static const char* PLANT_NAME = "SmartPlant";
 static const char* LOCATION = "Living Room";
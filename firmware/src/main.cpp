@@ -3,6 +3,7 @@
 #include <HTTPClient.h>
 #include <PubSubClient.h>
 #include <math.h>
+#include <string.h>
 #include "DHT.h"
 
 #include "config.h"
@@ -106,8 +107,40 @@ float readLux() {
     return lux;
 }
 
-String buildPayload(float temperature, float humidity, float lux) {
+// Identificador del nodo: DEVICE_ID o, si está vacío, la MAC Wi-Fi (12 caracteres hex).
+// El messageId sólo es único junto con él.
+String deviceId() {
+    static String id;
+    if (id.length() == 0) {
+        if (strlen(DEVICE_ID) > 0) {
+            id = DEVICE_ID;
+        } else {
+            uint8_t mac[6];
+            WiFi.macAddress(mac);
+            char hex[13];
+            snprintf(hex, sizeof(hex), "%02x%02x%02x%02x%02x%02x", mac[0], mac[1], mac[2], mac[3], mac[4], mac[5]);
+            id = hex;
+        }
+    }
+    return id;
+}
+
+// Identificador de cada lectura: el mismo en HTTP y MQTT, para que el backend
+// descarte la segunda entrega.
+uint32_t newMessageId() {
+    uint32_t id = 0;
+    while (id == 0) {  // 0 = sin identificador en el formato binario
+        id = esp_random();
+    }
+    return id;
+}
+
+String buildPayload(float temperature, float humidity, float lux, uint32_t messageId) {
+    char messageHex[9];
+    snprintf(messageHex, sizeof(messageHex), "%08lx", static_cast<unsigned long>(messageId));
     String payload = "{";
+    payload += "\"deviceId\":\"" + deviceId() + "\",";
+    payload += "\"messageId\":\"" + String(messageHex) + "\",";
     payload += "\"plantName\":\"" + String(PLANT_NAME) + "\",";
     payload += "\"location\":\"" + String(LOCATION) + "\",";
     payload += "\"temperature\":" + String(temperature, 2) + ",";
@@ -117,14 +150,44 @@ String buildPayload(float temperature, float humidity, float lux) {
     return payload;
 }
 
-bool sendViaHttp(const String& payload) {
+// Formato binario v2 (little-endian, igual que el ESP32):
+// cabecera [versión][nº muestras][timestamp u32][long. deviceId][messageId u32][deviceId] + 10 bytes por muestra
+// [antigüedad s u16][temperatura x100 i16][humedad x100 u16][luz f32].
+// Timestamp 0: el backend usa la hora de recepción (el nodo no tiene NTP).
+const char* BINARY_CONTENT_TYPE = "application/vnd.smartplant.uplink";
+const size_t BINARY_HEADER_SIZE = 11;
+const size_t BINARY_SAMPLE_SIZE = 10;
+const size_t BINARY_DEVICE_ID_MAX = 64;
+
+size_t buildBinaryPayload(uint8_t* buffer, float temperature, float humidity, float lux, uint32_t messageId) {
+    String id = deviceId();
+    size_t idLength = id.length();
+    if (idLength > BINARY_DEVICE_ID_MAX) idLength = BINARY_DEVICE_ID_MAX;
+    buffer[0] = 2;  // versión con messageId
+    buffer[1] = 1;  // una muestra
+    memset(buffer + 2, 0, 4);  // timestamp
+    buffer[6] = static_cast<uint8_t>(idLength);
+    memcpy(buffer + 7, &messageId, 4);
+    memcpy(buffer + BINARY_HEADER_SIZE, id.c_str(), idLength);
+    uint8_t* sample = buffer + BINARY_HEADER_SIZE + idLength;
+    uint16_t age = 0;
+    int16_t centiTemperature = static_cast<int16_t>(lroundf(temperature * 100.0f));
+    uint16_t centiHumidity = static_cast<uint16_t>(lroundf(humidity * 100.0f));
+    memcpy(sample, &age, 2);
+    memcpy(sample + 2, &centiTemperature, 2);
+    memcpy(sample + 4, &centiHumidity, 2);
+    memcpy(sample + 6, &lux, 4);
+    return BINARY_HEADER_SIZE + idLength + BINARY_SAMPLE_SIZE;
+}
+
+bool sendViaHttp(const uint8_t* payload, size_t length, const char* contentType) {
     if (!USE_HTTP) {
         return false;
     }
     HTTPClient http;
     http.begin(BACKEND_URL);
-    http.addHeader("Content-Type", "application/json");
-    int code = http.POST(payload);
+    http.addHeader("Content-Type", contentType);
+    int code = http.POST(const_cast<uint8_t*>(payload), length);
     if (code > 0) {
         logLine("HTTP -> " + String(code));
         logLine(http.getString());
@@ -135,7 +198,7 @@ bool sendViaHttp(const String& payload) {
     return code > 0 && code < 400;
 }
 
-bool sendViaMqtt(const String& payload) {
+bool sendViaMqtt(const char* topic, const uint8_t* payload, size_t length) {
     if (!USE_MQTT) {
         return false;
     }
@@ -147,7 +210,7 @@ bool sendViaMqtt(const String& payload) {
         return false;
     }
 
-    bool ok = mqttClient.publish(MQTT_TOPIC, payload.c_str());
+    bool ok = mqttClient.publish(topic, payload, length);
     logLine(ok ? "MQTT publish OK" : "MQTT publish falló");
     return ok;
 }
@@ -217,9 +280,20 @@ bool sampleAndSend() {
         }
     }
 
-    String payload = buildPayload(temperature, humidity, lux);
-    bool httpOk = sendViaHttp(payload);
-    bool mqttOk = sendViaMqtt(payload);
+    bool httpOk;
+    bool mqttOk;
+    uint32_t messageId = newMessageId();
+    if (USE_BINARY_UPLINK) {
+        uint8_t buffer[BINARY_HEADER_SIZE + BINARY_DEVICE_ID_MAX + BINARY_SAMPLE_SIZE];
+        size_t length = buildBinaryPayload(buffer, temperature, humidity, lux, messageId);
+        httpOk = sendViaHttp(buffer, length, BINARY_CONTENT_TYPE);
+        mqttOk = sendViaMqtt((String(MQTT_TOPIC) + "/bin").c_str(), buffer, length);
+    } else {
+        String payload = buildPayload(temperature, humidity, lux, messageId);
+        const uint8_t* bytes = reinterpret_cast<const uint8_t*>(payload.c_str());
+        httpOk = sendViaHttp(bytes, payload.length(), "application/json");
+        mqttOk = sendViaMqtt(MQTT_TOPIC, bytes, payload.length());
+    }
 
     bool anyOk = httpOk || mqttOk;
     bool tempOk = temperature >= TEMP_MIN && temperature <= TEMP_MAX;
@@ -12,6 +12,7 @@ let pendingPlantType = "";
 let currentProfile = null;
 let configConfirmed = false;
 let pollInterval = null;
+let liveStream = null;
 let savedConfigs = [];
 let activeConfig = null;
 
@@ -515,11 +516,34 @@ function showOverlay() {
   dom.configOverlay?.classList.add("active");
 }
 
+function isActiveObservation(observation) {
+  const cfgId = getActivePlantConfigId();
+  if (cfgId) return observation?.plantConfigId === cfgId;
+  const plantType = getActivePlantType();
+  return !plantType || observation?.plantType === plantType;
+}
+
+// El backend empuja cada lectura nueva por SSE; el sondeo queda como respaldo
+// y, gracias al ETag de /latest, un sondeo sin cambios sólo cuesta un 304.
+function openLiveStream() {
+  if (liveStream || typeof EventSource === "undefined") return;
+  liveStream = new EventSource(`${API_BASE}/stream`);
+  liveStream.addEventListener("observation", (event) => {
+    try {
+      const { observation } = JSON.parse(event.data);
+      if (isActiveObservation(observation)) refreshData();
+    } catch (error) {
+      console.error("Evento SSE inválido", error);
+    }
+  });
+}
+
 function startPolling() {
   if (pollInterval) return;
   configConfirmed = true;
   refreshData();
   pollInterval = setInterval(refreshData, REFRESH_MS);
+  openLiveStream();
 }
 
 dom.configForm?.addEventListener("submit", async (event) => {